@@ -2,37 +2,464 @@
 AI服务接口层 - 支持Ollama和自定义API
 """
 import os
+import re
+import atexit
+import time
+import queue
+import asyncio
+import threading
+import weakref
 import requests
-import json
-from typing import Dict, List, Optional, Any
+import httpx
+import orjson
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Optional, Any, Tuple, Iterator, AsyncIterator
 from abc import ABC, abstractmethod
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from response_cache import ResponseCache, response_cache
+from semantic_cache import semantic_cache
 
 load_dotenv()
 
+# 请求超时（连接超时, 读取超时）
+REQUEST_TIMEOUT = (5, 120)
+
+# 可用性探测的超时（连接超时, 读取超时），探测不重试，服务不可用时快速返回
+PROBE_TIMEOUT = (2, 5)
+
+# 请求体由orjson预先序列化，需显式声明类型
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# 可重试的状态码：限流和网关类错误
+RETRY_STATUS = (429, 500, 502, 503, 504)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+# Retry-After的最长等待时间（秒）
+MAX_RETRY_AFTER = 60
+
+# 单个服务默认的最大并发请求数
+DEFAULT_CONCURRENCY = 8
+
+# 异步请求等待线程信号量时的轮询间隔（秒），从最小值开始逐次翻倍
+PERMIT_POLL_MIN = 0.01
+PERMIT_POLL_MAX = 0.2
+
+# 自定义API服务的环境变量：API_KEY_1、API_BASE_URL_1、API_MODEL_1、API_CONCURRENCY_1 ...
+API_ENV_PATTERN = re.compile(r'^API_(KEY|BASE_URL|MODEL|CONCURRENCY)_(\d+)$')
+
+# httpx客户端配置
+HTTPX_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+HTTPX_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+# 同步入口共享的后台事件循环：异步HTTP客户端的连接池绑定在事件循环上，
+# 所有同步调用共用一个长期运行的循环，连接（及TLS会话）才能跨调用复用
+_shared_loop: Optional[asyncio.AbstractEventLoop] = None
+_shared_loop_lock = threading.Lock()
+
+# 创建过异步客户端的服务，独立事件循环结束前据此关闭该循环上的客户端
+_async_services: "weakref.WeakSet[AIServiceBase]" = weakref.WeakSet()
+
+
+def _get_shared_loop() -> asyncio.AbstractEventLoop:
+    """获取后台共享事件循环（懒加载），循环在守护线程中持续运行"""
+    global _shared_loop
+    if _shared_loop is None:
+        with _shared_loop_lock:
+            if _shared_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ai-service-loop", daemon=True).start()
+                _shared_loop = loop
+    return _shared_loop
+
+
+def _in_shared_loop() -> bool:
+    """当前线程是否正运行在后台共享事件循环中（此时阻塞等待会导致死锁）"""
+    try:
+        return asyncio.get_running_loop() is _shared_loop
+    except RuntimeError:
+        return False
+
+
+async def _run_isolated(coro):
+    """
+    在临时的独立事件循环中执行协程（配合asyncio.run使用）
+    
+    异步客户端按事件循环创建，临时循环结束后其连接池无法再复用，
+    因此在协程结束时关闭各服务在该循环上创建的客户端，避免连接泄漏。
+    """
+    try:
+        return await coro
+    finally:
+        for service in list(_async_services):
+            await service.aclose()
+
+
+def run_sync(coro):
+    """
+    在同步代码中执行协程
+    
+    协程提交到后台共享事件循环执行，当前线程阻塞等待结果；
+    已在共享循环内调用时改为在独立线程中执行，避免死锁。
+    
+    Args:
+        coro: 协程对象
+        
+    Returns:
+        协程的返回值
+    """
+    if _in_shared_loop():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, _run_isolated(coro)).result()
+    
+    return asyncio.run_coroutine_threadsafe(coro, _get_shared_loop()).result()
+
+
+def submit_async(coro) -> Future:
+    """
+    将协程提交到后台共享事件循环执行，不等待结果
+    
+    Args:
+        coro: 协程对象
+        
+    Returns:
+        协程结果的Future
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_shared_loop())
+
+
+def iter_sync(agen: AsyncIterator) -> Iterator:
+    """
+    在同步代码中逐项消费异步生成器
+    
+    异步生成器在后台共享事件循环中运行，每产生一项就通过队列交给调用方，
+    调用方无需等待全部完成即可处理已产生的结果。调用方提前结束迭代时取消事件循环中的消费协程，
+    并关闭异步生成器，使其finally中的清理逻辑（如取消尚未完成的子任务）得以执行。
+    
+    Args:
+        agen: 异步生成器
+        
+    Yields:
+        异步生成器产生的各项
+    """
+    items: queue.Queue = queue.Queue()
+    done = object()
+    # 在独立线程中运行时消费协程所在的 (事件循环, 任务)，用于调用方提前结束时取消
+    running: Dict[str, Any] = {}
+    # 调用方已结束迭代；消费协程尚未登记任务时无法被取消，启动时据此直接退出
+    stopped = threading.Event()
+    
+    async def pump():
+        # 先登记任务再检查停止标志，与调用方"先置标志再取消"的顺序配合，两者至少一方能看到对方
+        running["loop"], running["task"] = asyncio.get_running_loop(), asyncio.current_task()
+        try:
+            if stopped.is_set():
+                return
+            async for item in agen:
+                items.put((item, None))
+        except asyncio.CancelledError:
+            # 调用方已放弃迭代，没有人再读取队列
+            return
+        except Exception as e:
+            items.put((None, e))
+            return
+        finally:
+            await agen.aclose()
+        items.put((done, None))
+    
+    if _in_shared_loop():
+        threading.Thread(target=asyncio.run, args=(_run_isolated(pump()),), daemon=True).start()
+        future = None
+    else:
+        future = asyncio.run_coroutine_threadsafe(pump(), _get_shared_loop())
+    
+    finished = False
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                finished = True
+                raise error
+            if item is done:
+                finished = True
+                break
+            yield item
+    finally:
+        if not finished:
+            stopped.set()
+            if future is not None:
+                future.cancel()
+            elif "task" in running:
+                running["loop"].call_soon_threadsafe(running["task"].cancel)
+
+
+def _retry_delay(response, attempt: int) -> float:
+    """
+    计算重试前的等待时间，优先遵循服务端的Retry-After
+    
+    Args:
+        response: 需要重试的响应
+        attempt: 已重试次数
+        
+    Returns:
+        等待秒数
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    return RETRY_BACKOFF * (2 ** attempt)
+
+
+def _check_status(response):
+    """
+    检查响应状态码，失败时抛出包含响应摘要的异常
+    
+    Args:
+        response: requests或httpx的响应对象
+    """
+    if response.status_code >= 400:
+        if isinstance(response, httpx.Response):
+            # 流式响应需要先读取响应体
+            response.read()
+        raise Exception(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+def _iter_ndjson(response, chunk_size: int = 4096) -> Iterator[Dict[str, Any]]:
+    """
+    解析NDJSON流式响应
+    
+    直接读取原始字节流并按换行切分，避免iter_lines逐行解码的开销。
+    
+    Args:
+        response: 以stream=True发送的requests响应
+        chunk_size: 每次读取的字节数
+        
+    Yields:
+        每行解析后的JSON对象
+    """
+    buffer = bytearray()
+    for chunk in response.raw.stream(chunk_size, decode_content=True):
+        buffer.extend(chunk)
+        while (index := buffer.find(b"\n")) != -1:
+            line = bytes(buffer[:index])
+            del buffer[:index + 1]
+            if line.strip():
+                yield orjson.loads(line)
+    
+    if buffer.strip():
+        yield orjson.loads(bytes(buffer))
+
+
+def _build_http_session(headers: Dict[str, str] = None, retry: bool = True) -> requests.Session:
+    """
+    创建复用连接池的HTTP会话
+    
+    Args:
+        headers: 会话级默认请求头
+        retry: 是否对限流和网关类错误退避重试
+        
+    Returns:
+        配置了连接池和重试策略的Session
+    """
+    session = requests.Session()
+    max_retries = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=list(RETRY_STATUS),
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    ) if retry else 0
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=32, max_retries=max_retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
 
 class AIServiceBase(ABC):
     """AI服务基类"""
     
+    # 事件循环 -> 异步HTTP客户端，循环被回收后对应条目自动移除
+    _async_clients: Optional["weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]"] = None
+    _async_sem: Optional[asyncio.Semaphore] = None
+    _async_sem_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _init_limiter(self, max_concurrency: int):
+        """
+        初始化并发限制
+        
+        同步调用共享一个线程信号量，异步调用在每个事件循环中使用独立的协程信号量，
+        两者上限相同，避免并发超出服务商的速率限制后触发429。
+        
+        Args:
+            max_concurrency: 最大并发请求数
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self._sem = threading.BoundedSemaphore(self.max_concurrency)
+    
     @abstractmethod
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000) -> str:
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+             json_mode: bool = False) -> str:
         """发送聊天请求"""
         pass
     
+    @abstractmethod
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+                    json_mode: bool = False) -> Iterator[str]:
+        """流式发送聊天请求，逐段返回响应文本"""
+        pass
+    
+    @abstractmethod
+    async def achat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+                    json_mode: bool = False) -> str:
+        """异步发送聊天请求"""
+        pass
+    
     @abstractmethod
     def is_available(self) -> bool:
         """检查服务是否可用"""
         pass
+    
+    def _cache_key(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                   json_mode: bool = False) -> Optional[str]:
+        """计算响应缓存键，非确定性请求返回None"""
+        return ResponseCache.cache_key(self.base_url, self.model, messages, temperature, max_tokens, json_mode)
+    
+    async def achat_batch(self, batches: List[List[Dict[str, str]]], temperature: float = 0.7,
+                          max_tokens: int = 4000) -> List[Any]:
+        """
+        并发发送多组独立的聊天请求
+        
+        Args:
+            batches: 消息列表的列表，每一项为一次独立请求
+            temperature: 温度参数
+            max_tokens: 最大token数
+            
+        Returns:
+            与batches顺序一致的结果列表，失败的请求对应位置为异常对象
+        """
+        # 并发数由achat内部的服务级信号量限制
+        return await asyncio.gather(
+            *[self.achat(messages, temperature, max_tokens) for messages in batches],
+            return_exceptions=True
+        )
+    
+    def chat_batch(self, batches: List[List[Dict[str, str]]], temperature: float = 0.7,
+                   max_tokens: int = 4000) -> List[Any]:
+        """achat_batch的同步入口"""
+        return run_sync(self.achat_batch(batches, temperature, max_tokens))
+    
+    def _async_headers(self) -> Dict[str, str]:
+        """异步客户端的默认请求头"""
+        return self._headers
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """
+        获取异步HTTP客户端（懒加载）
+        
+        客户端的连接池绑定在事件循环上，每个事件循环各自持有一个客户端，
+        临时循环上的客户端不会替换共享循环上的客户端。
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_clients is None:
+            self._async_clients = weakref.WeakKeyDictionary()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self._async_headers(),
+                timeout=HTTPX_TIMEOUT,
+                limits=HTTPX_LIMITS,
+                http2=True
+            )
+            self._async_clients[loop] = client
+            _async_services.add(self)
+        return client
+    
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环的并发信号量，事件循环变化时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._async_sem is None or self._async_sem_loop is not loop:
+            self._async_sem = asyncio.Semaphore(self.max_concurrency)
+            self._async_sem_loop = loop
+        return self._async_sem
+    
+    async def _apost(self, url: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        异步发送POST请求，受并发信号量限制，遇到限流或网关类错误时退避重试
+        
+        Returns:
+            最终的响应对象
+        """
+        client = self._get_async_client()
+        async with self._get_async_semaphore():
+            # 多个线程各自运行事件循环时，协程信号量只在本循环内生效，
+            # 还需占用服务级的线程信号量，保证整个进程的并发不超过上限
+            await self._acquire_thread_permit()
+            try:
+                for attempt in range(MAX_RETRIES + 1):
+                    response = await client.post(url, content=orjson.dumps(payload))
+                    if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                        return response
+                    await asyncio.sleep(_retry_delay(response, attempt))
+            finally:
+                self._sem.release()
+    
+    async def _acquire_thread_permit(self):
+        """
+        在不阻塞事件循环的前提下获取服务级的线程信号量
+        
+        以非阻塞方式轮询，不占用默认线程池中的线程（否则大量等待会耗尽线程池，
+        拖慢会话读写等同样使用线程池的操作）；等待中被取消时不会遗留许可。
+        """
+        delay = PERMIT_POLL_MIN
+        while not self._sem.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PERMIT_POLL_MAX)
+    
+    async def aclose(self):
+        """关闭当前事件循环上的异步HTTP客户端"""
+        if self._async_clients is None:
+            return
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    def close(self):
+        """释放服务持有的连接资源"""
+        pass
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
 
 
 class OllamaService(AIServiceBase):
     """Ollama服务"""
     
-    def __init__(self, base_url: str = None, model: str = None):
+    def __init__(self, base_url: str = None, model: str = None, max_concurrency: int = None):
         self.base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.model = model or os.getenv("OLLAMA_DEFAULT_MODEL", "llama2")
+        # 请求头和URL在初始化时确定，请求路径上直接复用
+        self._headers = dict(JSON_HEADERS)
+        self._chat_url = f"{self.base_url}/api/chat"
+        self._tags_url = f"{self.base_url}/api/tags"
+        self._session = _build_http_session(self._headers)
+        # 可用性探测使用不重试的独立会话，服务宕机时启动和定期探测不会阻塞在退避等待上
+        self._probe_session = _build_http_session(retry=False)
+        self._init_limiter(max_concurrency or int(os.getenv("OLLAMA_CONCURRENCY", DEFAULT_CONCURRENCY)))
         
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000) -> str:
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+             json_mode: bool = False) -> str:
         """
         发送聊天请求到Ollama
         
@@ -40,50 +467,128 @@ class OllamaService(AIServiceBase):
             messages: 消息列表，格式 [{"role": "user", "content": "..."}]
             temperature: 温度参数
             max_tokens: 最大token数
+            json_mode: 是否要求模型输出合法的JSON
             
         Returns:
             模型响应文本
         """
+        cache_key = self._cache_key(messages, temperature, max_tokens, json_mode)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        content = "".join(self.chat_stream(messages, temperature, max_tokens, json_mode))
+        response_cache.set(cache_key, content)
+        return content
+    
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+                    json_mode: bool = False) -> Iterator[str]:
+        """
+        流式发送聊天请求到Ollama
+        
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大token数
+            json_mode: 是否要求模型输出合法的JSON
+            
+        Yields:
+            模型响应文本片段
+        """
         try:
-            url = f"{self.base_url}/api/chat"
-            
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    "temperature": temperature,
-                    "num_predict": max_tokens
-                }
-            }
+            payload = self._build_payload(messages, temperature, max_tokens, stream=True, json_mode=json_mode)
             
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
+            with self._sem, self._session.post(self._chat_url, data=orjson.dumps(payload),
+                                               stream=True, timeout=REQUEST_TIMEOUT) as response:
+                _check_status(response)
+                
+                # Ollama以NDJSON格式逐行返回
+                for chunk in _iter_ndjson(response):
+                    if chunk.get("error"):
+                        raise Exception(chunk["error"])
+                    content = chunk.get("message", {}).get("content", "")
+                    if content:
+                        yield content
             
-            result = response.json()
-            return result.get("message", {}).get("content", "")
+        except Exception as e:
+            raise Exception(f"Ollama服务调用失败: {str(e)}")
+    
+    async def achat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+                    json_mode: bool = False) -> str:
+        """异步发送聊天请求到Ollama"""
+        cache_key = self._cache_key(messages, temperature, max_tokens, json_mode)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            payload = self._build_payload(messages, temperature, max_tokens, json_mode=json_mode)
+            
+            response = await self._apost(self._chat_url, payload)
+            _check_status(response)
+            
+            try:
+                content = orjson.loads(response.content)["message"]["content"]
+            except (KeyError, TypeError):
+                content = ""
+            response_cache.set(cache_key, content)
+            return content
             
         except Exception as e:
             raise Exception(f"Ollama服务调用失败: {str(e)}")
     
+    def _build_payload(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                       stream: bool = False, json_mode: bool = False) -> Dict[str, Any]:
+        """构建请求体，json_mode为True时要求模型输出合法的JSON"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens
+            }
+        }
+        if json_mode:
+            payload["format"] = "json"
+        return payload
+    
     def is_available(self) -> bool:
         """检查Ollama服务是否可用"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self._probe_session.get(self._tags_url, timeout=PROBE_TIMEOUT)
             return response.status_code == 200
         except:
             return False
+    
+    def close(self):
+        """关闭HTTP会话"""
+        self._session.close()
+        self._probe_session.close()
 
 
 class CustomAPIService(AIServiceBase):
     """自定义API服务 - 兼容OpenAI格式的API"""
     
-    def __init__(self, api_key: str, base_url: str, model: str):
+    def __init__(self, api_key: str, base_url: str, model: str, max_concurrency: int = DEFAULT_CONCURRENCY):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
         self.model = model
+        # 请求头和URL在初始化时确定，请求路径上直接复用
+        self._headers = {"Authorization": f"Bearer {self.api_key}", **JSON_HEADERS}
+        self._chat_url = f"{self.base_url}/chat/completions"
+        self._models_url = f"{self.base_url}/models"
+        # HTTP/2客户端：同一服务的并发请求复用连接多路传输
+        self._client = httpx.Client(
+            headers=self._headers,
+            http2=True,
+            timeout=HTTPX_TIMEOUT,
+            limits=HTTPX_LIMITS
+        )
+        self._init_limiter(max_concurrency)
         
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000) -> str:
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+             json_mode: bool = False) -> str:
         """
         发送聊天请求到自定义API
         
@@ -91,102 +596,265 @@ class CustomAPIService(AIServiceBase):
             messages: 消息列表
             temperature: 温度参数
             max_tokens: 最大token数
+            json_mode: 是否要求模型输出合法的JSON
             
         Returns:
             模型响应文本
         """
+        cache_key = self._cache_key(messages, temperature, max_tokens, json_mode)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        content = "".join(self.chat_stream(messages, temperature, max_tokens, json_mode))
+        response_cache.set(cache_key, content)
+        return content
+    
+    def chat_stream(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+                    json_mode: bool = False) -> Iterator[str]:
+        """
+        流式发送聊天请求到自定义API
+        
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大token数
+            json_mode: 是否要求模型输出合法的JSON
+            
+        Yields:
+            模型响应文本片段
+        """
         try:
-            url = f"{self.base_url}/chat/completions"
+            payload = self._build_payload(messages, temperature, max_tokens, stream=True, json_mode=json_mode)
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            with self._sem:
+                response = self._send_stream("POST", self._chat_url, content=orjson.dumps(payload))
+                try:
+                    _check_status(response)
+                    # SSE响应通常不声明charset，显式按UTF-8解码
+                    response.encoding = "utf-8"
+                    
+                    for line in response.iter_lines():
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = orjson.loads(data)
+                        choices = chunk.get("choices") or [{}]
+                        content = choices[0].get("delta", {}).get("content")
+                        if content:
+                            yield content
+                finally:
+                    response.close()
             
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
+        except Exception as e:
+            raise Exception(f"自定义API服务调用失败 ({self.model}): {str(e)}")
+    
+    async def achat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 4000,
+                    json_mode: bool = False) -> str:
+        """异步发送聊天请求到自定义API"""
+        cache_key = self._cache_key(messages, temperature, max_tokens, json_mode)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            payload = self._build_payload(messages, temperature, max_tokens, json_mode=json_mode)
             
-            response = requests.post(url, headers=headers, json=payload, timeout=120)
-            response.raise_for_status()
+            response = await self._apost(self._chat_url, payload)
+            _check_status(response)
             
-            result = response.json()
-            return result.get("choices", [{}])[0].get("message", {}).get("content", "")
+            try:
+                content = orjson.loads(response.content)["choices"][0]["message"]["content"] or ""
+            except (KeyError, IndexError, TypeError):
+                content = ""
+            response_cache.set(cache_key, content)
+            return content
             
         except Exception as e:
             raise Exception(f"自定义API服务调用失败 ({self.model}): {str(e)}")
     
+    def _build_payload(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                       stream: bool = False, json_mode: bool = False) -> Dict[str, Any]:
+        """构建请求体，json_mode为True时要求模型输出合法的JSON"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream
+        }
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+    
+    def _send_stream(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        以流式方式发送请求，遇到限流或网关类错误时按Retry-After或指数退避重试
+        
+        Returns:
+            未读取响应体的响应对象，调用方负责关闭
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            request = self._client.build_request(method, url, **kwargs)
+            response = self._client.send(request, stream=True)
+            if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                return response
+            
+            response.close()
+            time.sleep(_retry_delay(response, attempt))
+    
     def is_available(self) -> bool:
         """检查自定义API服务是否可用"""
         try:
-            url = f"{self.base_url}/models"
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(url, headers=headers, timeout=5)
+            response = self._client.get(self._models_url, timeout=httpx.Timeout(PROBE_TIMEOUT[1], connect=PROBE_TIMEOUT[0]))
             return response.status_code == 200
         except:
             return False
+    
+    def close(self):
+        """关闭HTTP客户端"""
+        self._client.close()
 
 
 class AIServiceManager:
     """AI服务管理器 - 管理多个AI服务"""
     
+    # 可用性探测结果的缓存时间（秒）
+    AVAILABILITY_TTL = 60
+    
     def __init__(self):
         self.services: Dict[str, AIServiceBase] = {}
+        self._avail_cache: Dict[str, Tuple[float, bool]] = {}
+        self._default_service: Optional[AIServiceBase] = None
+        # 模型档位（如small、large）到服务名称的映射
+        self.model_tiers: Dict[str, str] = {}
+        self._prewarmed = False
         self._load_services()
         
     def _load_services(self):
         """从环境变量加载所有可用的AI服务"""
+        # 需要在启动时探测可用性的服务 (服务名称, 显示名称, 服务实例)，并发探测
+        candidates: List[Tuple[str, str, AIServiceBase]] = []
+        
         # 加载Ollama服务
         if os.getenv("OLLAMA_BASE_URL"):
-            ollama = OllamaService()
-            if ollama.is_available():
-                self.services["ollama"] = ollama
-                print("✓ Ollama服务已加载")
+            candidates.append(("ollama", "Ollama", OllamaService()))
         
-        # 加载自定义API服务
-        i = 1
-        while True:
-            api_key = os.getenv(f"API_KEY_{i}")
-            api_base_url = os.getenv(f"API_BASE_URL_{i}")
-            api_model = os.getenv(f"API_MODEL_{i}")
-            
-            if not all([api_key, api_base_url, api_model]):
-                break
+        results = self._probe([service for _, _, service in candidates])
+        for (name, label, service), available in zip(candidates, results):
+            if available:
+                self.services[name] = service
+                self._avail_cache[name] = (time.monotonic(), True)
+                print(f"✓ {label}服务已加载")
+        
+        # 自定义API服务直接加载，可用性在首次健康检查时探测
+        # 加载自定义API服务：一次遍历环境变量，按编号分组
+        configs: Dict[int, Dict[str, str]] = defaultdict(dict)
+        for key, value in os.environ.items():
+            match = API_ENV_PATTERN.match(key)
+            if match and value:
+                configs[int(match.group(2))][match.group(1)] = value
+        
+        for i in sorted(configs):
+            config = configs[i]
+            if not {"KEY", "BASE_URL", "MODEL"} <= config.keys():
+                continue
             
+            api_model = config["MODEL"]
             try:
-                service = CustomAPIService(api_key, api_base_url, api_model)
+                max_concurrency = int(config.get("CONCURRENCY", DEFAULT_CONCURRENCY))
+                service = CustomAPIService(config["KEY"], config["BASE_URL"], api_model, max_concurrency)
                 service_name = f"api_{i}_{api_model}"
                 self.services[service_name] = service
                 print(f"✓ 自定义API服务已加载: {service_name}")
             except Exception as e:
                 print(f"✗ 自定义API服务加载失败 (API_{i}): {str(e)}")
-            
-            i += 1
+        
+        # 缓存默认服务，避免每次请求都构建服务列表
+        self._default_service = next(iter(self.services.values()), None)
         
         if not self.services:
             print("⚠ 警告: 没有可用的AI服务，请检查配置")
     
-    def get_service(self, service_name: str = None) -> Optional[AIServiceBase]:
+    @staticmethod
+    def _probe(services: List[AIServiceBase]) -> List[bool]:
+        """并发探测服务可用性"""
+        if not services:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(16, len(services))) as executor:
+            return list(executor.map(lambda service: service.is_available(), services))
+    
+    def check_availability(self) -> Dict[str, bool]:
+        """
+        检查所有服务的可用性
+        
+        探测结果缓存AVAILABILITY_TTL秒，过期的服务并发重新探测。
+        
+        Returns:
+            服务名称到可用性的映射
+        """
+        now = time.monotonic()
+        stale = [
+            name for name in self.services
+            if name not in self._avail_cache or now - self._avail_cache[name][0] >= self.AVAILABILITY_TTL
+        ]
+        
+        for name, available in zip(stale, self._probe([self.services[name] for name in stale])):
+            self._avail_cache[name] = (time.monotonic(), available)
+        
+        return {name: self._avail_cache[name][1] for name in self.services}
+    
+    def prewarm(self):
+        """
+        在后台线程中预热各服务的连接池
+        
+        对每个服务发起一次可用性探测，提前完成TCP/TLS握手并刷新可用性缓存，
+        使第一次对话请求无需承担建连开销。
+        """
+        if self._prewarmed or not self.services:
+            return
+        self._prewarmed = True
+        
+        threading.Thread(target=self.check_availability, name="ai-service-prewarm", daemon=True).start()
+    
+    def configure_model_tiers(self, tiers: Optional[Dict[str, str]]):
+        """
+        配置模型档位到服务名称的映射
+        
+        Args:
+            tiers: 档位到服务名称的映射，值为空或服务未加载的档位使用默认服务
+        """
+        self.model_tiers = {}
+        for tier, service_name in (tiers or {}).items():
+            if not service_name:
+                continue
+            if service_name in self.services:
+                self.model_tiers[tier] = service_name
+            else:
+                print(f"⚠ 模型档位 {tier} 配置的服务未加载: {service_name}")
+    
+    def get_service(self, service_name: str = None, model_tier: str = None) -> Optional[AIServiceBase]:
         """
         获取指定的AI服务
         
         Args:
-            service_name: 服务名称，如果为None则返回第一个可用服务
+            service_name: 服务名称，优先于model_tier
+            model_tier: 模型档位，未配置时忽略
             
         Returns:
-            AI服务实例
+            AI服务实例，都未指定时返回第一个可用服务
         """
         if service_name:
             return self.services.get(service_name)
         
-        # 返回第一个可用服务
-        if self.services:
-            return list(self.services.values())[0]
+        if model_tier in self.model_tiers:
+            return self.services[self.model_tiers[model_tier]]
         
-        return None
+        # 返回第一个可用服务
+        return self._default_service
     
     def get_all_services(self) -> Dict[str, AIServiceBase]:
         """获取所有可用的AI服务"""
@@ -197,7 +865,8 @@ class AIServiceManager:
         return list(self.services.keys())
     
     def chat(self, messages: List[Dict[str, str]], service_name: str = None, 
-             temperature: float = 0.7, max_tokens: int = 4000) -> str:
+             temperature: float = 0.7, max_tokens: int = 4000, json_mode: bool = False,
+             model_tier: str = None) -> str:
         """
         使用指定服务进行对话
         
@@ -206,16 +875,136 @@ class AIServiceManager:
             service_name: 服务名称
             temperature: 温度参数
             max_tokens: 最大token数
+            json_mode: 是否要求模型输出合法的JSON（Ollama的format或OpenAI的response_format）
+            model_tier: 模型档位，未指定服务名称时按档位选择服务
             
         Returns:
             模型响应文本
         """
+        service = self.get_service(service_name, model_tier)
+        if not service:
+            raise Exception("没有可用的AI服务")
+        
+        # 采样调用（temperature > 0）每次应得到不同结果，不经过语义缓存
+        if semantic_cache is None or temperature != 0:
+            return service.chat(messages, temperature, max_tokens, json_mode)
+        
+        query, namespace = self._semantic_cache_query(messages, service, temperature, max_tokens, json_mode)
+        cached = semantic_cache.lookup(query, namespace)
+        if cached is not None:
+            return cached
+        
+        response = service.chat(messages, temperature, max_tokens, json_mode)
+        semantic_cache.add(query, response, namespace)
+        return response
+    
+    def chat_batch(self, batches: List[List[Dict[str, str]]], service_name: str = None,
+                   temperature: float = 0.7, max_tokens: int = 4000) -> List[Any]:
+        """
+        使用指定服务批量发送多组独立的对话请求
+        
+        Args:
+            batches: 消息列表的列表
+            service_name: 服务名称
+            temperature: 温度参数
+            max_tokens: 最大token数
+            
+        Returns:
+            与batches顺序一致的结果列表，失败的请求对应位置为异常对象
+        """
         service = self.get_service(service_name)
         if not service:
             raise Exception("没有可用的AI服务")
         
-        return service.chat(messages, temperature, max_tokens)
+        return service.chat_batch(batches, temperature, max_tokens)
+    
+    def chat_stream(self, messages: List[Dict[str, str]], service_name: str = None,
+                    temperature: float = 0.7, max_tokens: int = 4000) -> Iterator[str]:
+        """
+        使用指定服务进行流式对话
+        
+        Args:
+            messages: 消息列表
+            service_name: 服务名称
+            temperature: 温度参数
+            max_tokens: 最大token数
+            
+        Yields:
+            模型响应文本片段
+        """
+        service = self.get_service(service_name)
+        if not service:
+            raise Exception("没有可用的AI服务")
+        
+        yield from service.chat_stream(messages, temperature, max_tokens)
+    
+    def _semantic_cache_query(self, messages: List[Dict[str, str]], service: AIServiceBase,
+                              temperature: float, max_tokens: int, json_mode: bool = False) -> Tuple[str, str]:
+        """
+        构建语义缓存的查询文本和命名空间
+        
+        查询文本为带角色前缀的完整对话（含助手回复），只有整段对话相近时才会命中，
+        避免不同会话中相同的用户输入互相复用；系统提示词、模型和生成参数不同的
+        请求划入不同命名空间，避免跨角色复用响应。
+        """
+        query = "\n".join(f"{m['role']}: {m['content']}" for m in messages if m["role"] != "system")
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        namespace = f"{service.base_url}|{service.model}|{temperature}|{max_tokens}|{system}"
+        if json_mode:
+            namespace = f"json|{namespace}"
+        return query, namespace
+    
+    async def achat(self, messages: List[Dict[str, str]], service_name: str = None,
+                    temperature: float = 0.7, max_tokens: int = 4000, json_mode: bool = False,
+                    model_tier: str = None) -> str:
+        """
+        使用指定服务进行异步对话
+        
+        Args:
+            messages: 消息列表
+            service_name: 服务名称
+            temperature: 温度参数
+            max_tokens: 最大token数
+            json_mode: 是否要求模型输出合法的JSON
+            model_tier: 模型档位，未指定服务名称时按档位选择服务
+            
+        Returns:
+            模型响应文本
+        """
+        service = self.get_service(service_name, model_tier)
+        if not service:
+            raise Exception("没有可用的AI服务")
+        
+        if semantic_cache is None or temperature != 0:
+            return await service.achat(messages, temperature, max_tokens, json_mode)
+        
+        # 句向量编码是阻塞的CPU计算，放到线程中执行以免阻塞事件循环
+        query, namespace = self._semantic_cache_query(messages, service, temperature, max_tokens, json_mode)
+        cached = await asyncio.to_thread(semantic_cache.lookup, query, namespace)
+        if cached is not None:
+            return cached
+        
+        response = await service.achat(messages, temperature, max_tokens, json_mode)
+        await asyncio.to_thread(semantic_cache.add, query, response, namespace)
+        return response
+    
+    def close(self):
+        """关闭所有服务的连接池，进程退出时调用"""
+        for service in self.services.values():
+            # 共享事件循环上的异步客户端需在该循环内关闭
+            if _shared_loop is not None and service._async_clients and _shared_loop in service._async_clients:
+                try:
+                    asyncio.run_coroutine_threadsafe(service.aclose(), _shared_loop).result(timeout=5)
+                except Exception as e:
+                    print(f"关闭异步客户端失败: {str(e)}")
+            service.close()
+        
+        if _shared_loop is not None:
+            _shared_loop.call_soon_threadsafe(_shared_loop.stop)
 
 
 # 全局服务管理器实例
 ai_service_manager = AIServiceManager()
+
+# 进程退出时关闭HTTP连接池
+atexit.register(ai_service_manager.close)
@@ -1,29 +1,51 @@
 """
 Flask API服务 - 学术论文智能体后端
 """
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
+import time
+import hashlib
+import orjson
 from dotenv import load_dotenv
 from datetime import datetime
-import io
+from functools import lru_cache
+from typing import Tuple
+from urllib.parse import quote
 
 from paper_generator import paper_generator
 from conversation_manager import conversation_manager
 from ai_service import ai_service_manager
-from collaboration_engine import collaboration_engine
+from collaboration_engine import get_engine
+from response_cache import response_cache
+from semantic_cache import semantic_cache
+from task_queue import task_queue
 
 # 加载环境变量
 load_dotenv()
 
+class ORJSONProvider(DefaultJSONProvider):
+    """基于orjson的JSON序列化，直接输出UTF-8，不转义中文"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # 创建Flask应用
 app = Flask(__name__, 
             template_folder='templates',
             static_folder='static')
+app.json = ORJSONProvider(app)
 CORS(app)  # 启用跨域支持
 
-# 配置
-app.config['JSON_AS_ASCII'] = False
+# 配置（JSON由orjson直接输出UTF-8中文，无需JSON_AS_ASCII）
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
 
 
@@ -45,9 +67,13 @@ def api_index():
         "endpoints": {
             "start_paper": "/api/paper/start",
             "send_message": "/api/paper/message",
+            "send_message_stream": "/api/paper/message/stream",
+            "generate_paper_stream": "/api/paper/generate/stream",
             "get_session": "/api/paper/session/<session_id>",
             "list_sessions": "/api/paper/sessions",
             "regenerate_section": "/api/paper/regenerate",
+            "generate_all_sections": "/api/paper/generate_all",
+            "get_task": "/api/paper/task/<task_id>",
             "export_paper": "/api/paper/export/<session_id>",
             "get_services": "/api/services",
             "health": "/api/health"
@@ -64,21 +90,76 @@ def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "ai_services": services,
-        "ai_services_count": len(services)
+        "ai_services_count": len(services),
+        "ai_services_available": ai_service_manager.check_availability(),
+        "llm_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None
     })
 
 
+# /api/services响应的缓存时间（秒）
+SERVICES_CACHE_TTL = 30
+
+
+@lru_cache(maxsize=1)
+def _services_payload(epoch: int) -> Tuple[bytes, str]:
+    """
+    构建服务列表响应体，同一时间窗口内复用
+    
+    Args:
+        epoch: 时间窗口编号，窗口变化时缓存失效
+        
+    Returns:
+        (响应体, ETag)
+    """
+    body = app.json.dumps({
+        "services": ai_service_manager.get_service_names(),
+        "role_mapping": get_engine().get_service_mapping(),
+        "role_info": get_engine().get_role_info()
+    }).encode('utf-8')
+    return body, hashlib.md5(body).hexdigest()
+
+
 @app.route('/api/services', methods=['GET'])
 def get_services():
     """获取可用的AI服务列表"""
-    services = ai_service_manager.get_service_names()
-    role_mapping = collaboration_engine.get_service_mapping()
-    role_info = collaboration_engine.get_role_info()
+    body, etag = _services_payload(int(time.time() // SERVICES_CACHE_TTL))
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={SERVICES_CACHE_TTL}'
+    return response
+
+
+def run_or_enqueue(func, *args, async_mode: bool = False):
+    """
+    同步执行任务，或提交到后台任务队列后立即返回任务ID
+    
+    Args:
+        func: 任务函数，返回值作为响应的data字段
+        *args: 任务参数
+        async_mode: 是否后台执行
+        
+    Returns:
+        Flask响应
+    """
+    if async_mode:
+        task_id = task_queue.submit(func, *args)
+        return jsonify({
+            "success": True,
+            "data": {
+                "task_id": task_id,
+                "status": "pending"
+            }
+        }), 202
     
     return jsonify({
-        "services": services,
-        "role_mapping": role_mapping,
-        "role_info": role_info
+        "success": True,
+        "data": func(*args)
     })
 
 
@@ -141,12 +222,14 @@ def send_message():
                 "error": "缺少session_id或message参数"
             }), 400
         
-        result = paper_generator.process_user_input(session_id, message)
-        
-        return jsonify({
-            "success": True,
-            "data": result
-        })
+        # 后台模式下提交协程版本，在共享事件循环中与其他会话并发处理
+        async_mode = bool(data.get('async'))
+        return run_or_enqueue(
+            paper_generator.process_user_input_async if async_mode else paper_generator.process_user_input,
+            session_id,
+            message,
+            async_mode=async_mode
+        )
     
     except Exception as e:
         return jsonify({
@@ -155,6 +238,50 @@ def send_message():
         }), 500
 
 
+@app.route('/api/paper/message/stream', methods=['POST'])
+def send_message_stream():
+    """发送用户消息（以Server-Sent Events流式返回）"""
+    data = request.json
+    session_id = data.get('session_id')
+    message = data.get('message')
+    
+    if not session_id or not message:
+        return jsonify({
+            "success": False,
+            "error": "缺少session_id或message参数"
+        }), 400
+    
+    return sse_response(paper_generator.process_user_input_stream(session_id, message))
+
+
+def sse_response(events) -> Response:
+    """
+    将事件流以Server-Sent Events返回，处理过程中的异常作为error事件发送
+    
+    Args:
+        events: 事件字典的迭代器
+        
+    Returns:
+        text/event-stream响应
+    """
+    def generate():
+        try:
+            for event in events:
+                yield f"data: {orjson.dumps(event).decode('utf-8')}\n\n"
+        except Exception as e:
+            error_event = {"type": "error", "error": str(e)}
+            yield f"data: {orjson.dumps(error_event).decode('utf-8')}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @app.route('/api/paper/session/<session_id>', methods=['GET'])
 def get_session(session_id):
     """获取会话详情"""
@@ -170,10 +297,15 @@ def get_session(session_id):
         # 获取论文内容
         paper_content = paper_generator.get_paper_content(session_id)
         
+        # 会话对象只在内存中保留最近的消息，完整历史从消息日志读取
+        session_data = session.to_dict()
+        # Message为dataclass，由orjson直接序列化
+        session_data["messages"] = conversation_manager.get_messages(session_id)
+        
         return jsonify({
             "success": True,
             "data": {
-                "session": session.to_dict(),
+                "session": session_data,
                 "paper_content": paper_content
             }
         })
@@ -187,28 +319,22 @@ def get_session(session_id):
 
 @app.route('/api/paper/sessions', methods=['GET'])
 def list_sessions():
-    """获取会话列表"""
+    """获取会话列表（分页）"""
     try:
         user_id = request.args.get('user_id')
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        cursor = request.args.get('cursor')
         
-        sessions = conversation_manager.list_sessions(user_id)
-        
-        sessions_data = [
-            {
-                "session_id": s.session_id,
-                "user_id": s.user_id,
-                "title": s.title,
-                "status": s.status,
-                "created_at": s.created_at,
-                "updated_at": s.updated_at,
-                "message_count": len(s.messages)
-            }
-            for s in sessions
-        ]
+        # 一页最多limit条，直接构建完整结果，出错时由下方统一返回错误响应，不会输出截断的JSON
+        sessions = list(conversation_manager.list_session_summaries(user_id, limit, cursor))
+        
+        # 取满一页时返回下一页游标
+        next_cursor = conversation_manager.summary_cursor(sessions[-1]) if len(sessions) == limit else None
         
         return jsonify({
             "success": True,
-            "data": sessions_data
+            "data": sessions,
+            "next_cursor": next_cursor
         })
     
     except Exception as e:
@@ -233,16 +359,13 @@ def regenerate_section():
                 'error': '缺少session_id或section参数'
             }), 400
         
-        result = paper_generator.regenerate_section(
+        return run_or_enqueue(
+            paper_generator.regenerate_section,
             session_id, 
             section, 
-            requirements
+            requirements,
+            async_mode=bool(data.get('async'))
         )
-        
-        return jsonify({
-            'success': True,
-            'data': result
-        })
     
     except Exception as e:
         return jsonify({
@@ -264,21 +387,71 @@ def generate_paper():
                 'error': '缺少session_id参数'
             }), 400
         
-        # 获取已收集的信息
-        context = conversation_manager.get_context(session_id)
-        collected_info = context.get('collected_info', {})
+        return run_or_enqueue(_generate_paper, session_id, async_mode=bool(data.get('async')))
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/paper/generate/stream', methods=['POST'])
+def generate_paper_stream():
+    """直接生成完整论文（以Server-Sent Events逐章节返回）"""
+    data = request.json
+    session_id = data.get('session_id')
+    
+    if not session_id:
+        return jsonify({
+            'success': False,
+            'error': '缺少session_id参数'
+        }), 400
+    
+    return sse_response(paper_generator.generate_paper_stream(session_id))
+
+
+def _generate_paper(session_id: str) -> dict:
+    """生成完整论文并保存，返回论文内容"""
+    # 获取已收集的信息
+    context = conversation_manager.get_context(session_id)
+    collected_info = context.get('collected_info', {})
+    
+    # 生成论文
+    paper_content = paper_generator._generate_full_paper(session_id, collected_info)
+    
+    # 保存论文内容
+    paper_generator.save_paper_content(session_id, paper_content, current_stage='completed')
+    
+    # 更新会话状态
+    conversation_manager.update_session_status(session_id, 'completed')
+    
+    return {
+        'paper_content': paper_content,
+        'session_id': session_id
+    }
+
+
+@app.route('/api/paper/generate_all', methods=['POST'])
+def generate_all_sections():
+    """批量快速生成完整论文（所有章节一次性并发生成，不经过审核优化迭代）"""
+    try:
+        data = request.json
+        session_id = data.get('session_id')
         
-        # 生成论文
-        paper_content = paper_generator._generate_full_paper(session_id, collected_info)
+        if not session_id:
+            return jsonify({
+                'success': False,
+                'error': '缺少session_id参数'
+            }), 400
         
-        # 保存论文内容
-        conversation_manager.update_context(session_id, {
-            'paper_content': paper_content,
-            'current_stage': 'completed'
-        })
+        if not conversation_manager.get_session(session_id):
+            return jsonify({
+                'success': False,
+                'error': '会话不存在'
+            }), 404
         
-        # 更新会话状态
-        conversation_manager.update_session_status(session_id, 'completed')
+        paper_content = paper_generator.generate_all_sections(session_id)
         
         return jsonify({
             'success': True,
@@ -295,16 +468,31 @@ def generate_paper():
         }), 500
 
 
+@app.route('/api/paper/task/<task_id>', methods=['GET'])
+def get_task(task_id):
+    """查询后台任务状态"""
+    task = task_queue.get(task_id)
+    
+    if not task:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': task
+    })
+
+
 @app.route('/api/paper/export/<session_id>', methods=['GET'])
 def export_paper(session_id):
     """导出论文"""
     try:
         format = request.args.get('format', 'markdown')
         
-        # 获取论文内容
-        content = paper_generator.export_paper(session_id, format)
-        
-        if not content:
+        # 检查论文内容
+        if not paper_generator.get_paper_content(session_id):
             return jsonify({
                 "success": False,
                 "error": "论文内容不存在"
@@ -321,15 +509,13 @@ def export_paper(session_id):
             filename += '.txt'
             mimetype = 'text/plain'
         
-        # 创建文件对象
-        file_obj = io.BytesIO(content.encode('utf-8'))
-        file_obj.seek(0)
-        
-        return send_file(
-            file_obj,
+        # 按章节流式输出，文件名按RFC 5987编码以支持中文标题
+        return Response(
+            stream_with_context(paper_generator.export_paper_iter(session_id, format)),
             mimetype=mimetype,
-            as_attachment=True,
-            download_name=filename
+            headers={
+                'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"
+            }
         )
     
     except Exception as e:
@@ -381,11 +567,9 @@ def get_messages(session_id):
     try:
         messages = conversation_manager.get_messages(session_id)
         
-        messages_data = [msg.to_dict() for msg in messages]
-        
         return jsonify({
             "success": True,
-            "data": messages_data
+            "data": messages
         })
     
     except Exception as e:
@@ -399,18 +583,25 @@ def get_messages(session_id):
 def get_paper_content(session_id):
     """获取论文内容"""
     try:
-        paper_content = paper_generator.get_paper_content(session_id)
+        etag = paper_generator.get_paper_etag(session_id)
         
-        if not paper_content:
+        if not etag:
             return jsonify({
                 "success": False,
                 "error": "论文内容不存在"
             }), 404
         
-        return jsonify({
-            "success": True,
-            "data": paper_content
-        })
+        # 内容未变化时直接返回304，跳过序列化
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify({
+                "success": True,
+                "data": paper_generator.get_paper_content(session_id)
+            })
+        
+        response.set_etag(etag)
+        return response
     
     except Exception as e:
         return jsonify({
@@ -443,15 +634,21 @@ if __name__ == '__main__':
     
     # 获取配置
     port = int(os.getenv('FLASK_PORT', 5000))
-    debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+    
+    # 调试器和重载器会串行化请求并带来额外开销，生产环境禁止开启
+    if debug and os.getenv('FLASK_ENV') == 'production':
+        raise SystemExit("错误: 生产环境(FLASK_ENV=production)不允许开启调试模式，请设置FLASK_DEBUG=False")
     
     print("=" * 60)
     print("学术论文智能体服务启动中...")
     print(f"服务地址: http://localhost:{port}")
     print(f"调试模式: {debug}")
+    if os.getenv('FLASK_ENV') == 'production':
+        print("提示: 当前为开发服务器，生产环境请使用 gunicorn -c gunicorn.conf.py wsgi:app")
     print("=" * 60)
     
-    # 启动服务
+    # 启动开发服务器（生产环境使用gunicorn加载wsgi.py）
     app.run(
         host='0.0.0.0',
         port=port,
@@ -1,10 +1,81 @@
 """
 多模型协作引擎
 """
+import os
+import copy
 import yaml
-from typing import Dict, List, Any, Optional
-from ai_service import ai_service_manager, AIServiceBase
+import orjson
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Iterator, AsyncIterator
+from ai_service import ai_service_manager, AIServiceBase, run_sync, iter_sync
 from prompt_templates import PromptTemplates
+from response_cache import InMemoryLRU
+
+try:
+    # 优先使用LibYAML的C实现
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
+
+# 配置文件解析结果缓存：路径 -> ((修改时间, 文件大小), 配置字典)
+_CONFIG_CACHE: "OrderedDict[str, Tuple[Tuple[float, int], Dict]]" = OrderedDict()
+_CONFIG_CACHE_SIZE = 100
+_CONFIG_CACHE_LOCK = threading.Lock()
+
+# 角色调用的响应缓存容量
+ROLE_CACHE_SIZE = 512
+
+# 一次请求生成全部章节时的最大token数
+COMBINED_MAX_TOKENS = 16000
+
+# 信息收集时携带的对话历史条数上限（最近3轮对话）
+COLLECTION_HISTORY_LIMIT = 6
+
+# 尚未收集到任何信息时的提示词：(角色, 章节或阶段) -> 提示词
+_EMPTY_INFO_PROMPTS: Dict[Tuple[str, str], str] = {}
+
+
+def load_config(config_path: str = "config.yaml") -> Dict:
+    """
+    加载YAML配置文件
+    
+    解析结果按文件的修改时间和大小缓存，文件变化后自动重新解析；
+    返回深拷贝，调用方可以安全地修改。
+    
+    Args:
+        config_path: 配置文件路径
+        
+    Returns:
+        配置字典，加载失败时返回空字典
+    """
+    try:
+        path = os.path.abspath(config_path)
+        stat = os.stat(path)
+        version = (stat.st_mtime, stat.st_size)
+        
+        with _CONFIG_CACHE_LOCK:
+            cached = _CONFIG_CACHE.get(path)
+            if cached and cached[0] == version:
+                _CONFIG_CACHE.move_to_end(path)
+                return copy.deepcopy(cached[1])
+        
+        with open(path, 'r', encoding='utf-8') as f:
+            config = yaml.load(f, Loader=_SafeLoader) or {}
+        
+        with _CONFIG_CACHE_LOCK:
+            _CONFIG_CACHE[path] = (version, config)
+            _CONFIG_CACHE.move_to_end(path)
+            while len(_CONFIG_CACHE) > _CONFIG_CACHE_SIZE:
+                _CONFIG_CACHE.popitem(last=False)
+        
+        return copy.deepcopy(config)
+    except Exception as e:
+        print(f"加载配置文件失败: {str(e)}")
+        return {}
 
 
 class ModelRole:
@@ -15,25 +86,48 @@ class ModelRole:
     STRUCTURE_OPTIMIZER = "structure_optimizer"
 
 
+# 各角色未在配置中指定时的默认 (温度参数, 系统提示词)
+ROLE_DEFAULTS = {
+    ModelRole.INFORMATION_COLLECTOR: (0.7, "信息收集专家"),
+    ModelRole.CONTENT_GENERATOR: (0.8, "内容生成专家"),
+    ModelRole.QUALITY_REVIEWER: (0.3, "质量审核专家"),
+    ModelRole.STRUCTURE_OPTIMIZER: (0.5, "结构优化专家")
+}
+
+# 各角色使用的模型档位：审核只需给出评分和建议，使用较小的模型；其余角色使用大模型
+ROLE_TIERS = {
+    ModelRole.INFORMATION_COLLECTOR: "large",
+    ModelRole.CONTENT_GENERATOR: "large",
+    ModelRole.QUALITY_REVIEWER: "small",
+    ModelRole.STRUCTURE_OPTIMIZER: "large"
+}
+
+
 class MultiModelCollaborationEngine:
     """多模型协作引擎"""
     
     def __init__(self, config_path: str = "config.yaml"):
         self.config = self._load_config(config_path)
         self.service_manager = ai_service_manager
+        self.service_manager.configure_model_tiers(self.config.get("paper_generation", {}).get("models"))
         self.role_config = self.config.get("model_collaboration", {}).get("roles", {})
+        self.max_concurrent_sections = self.config.get("model_collaboration", {}).get("max_concurrent_sections", 7)
         
         # 为不同角色分配不同的服务（如果有多个服务可用）
         self.role_service_mapping = self._assign_services_to_roles()
+        
+        # 角色的温度参数、系统提示词和服务在初始化时解析一次
+        self._role_cached = self._cache_roles()
+        
+        # 角色调用的响应缓存：内容收敛或用户重试时相同的请求不再重复调用模型
+        self._response_cache = InMemoryLRU(maxsize=ROLE_CACHE_SIZE)
+        
+        # 提前建立到各服务的连接，第一次信息收集请求不再承担握手开销
+        self.service_manager.prewarm()
     
     def _load_config(self, config_path: str) -> Dict:
         """加载配置文件"""
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
-        except Exception as e:
-            print(f"加载配置文件失败: {str(e)}")
-            return {}
+        return load_config(config_path)
     
     def _assign_services_to_roles(self) -> Dict[str, str]:
         """为不同角色分配AI服务"""
@@ -66,7 +160,139 @@ class MultiModelCollaborationEngine:
         
         return mapping
     
-    def collect_information(self, 
+    def _cache_roles(self) -> Dict[str, Tuple[float, str, Optional[str]]]:
+        """
+        预先解析每个角色的 (温度参数, 系统提示词, 服务名称)
+        
+        配置了角色所属模型档位的服务时使用该服务，否则使用按角色轮流分配的服务。
+        """
+        cached = {}
+        model_tiers = self.service_manager.model_tiers
+        for role, (default_temperature, default_system) in ROLE_DEFAULTS.items():
+            role_config = self.role_config.get(role, {})
+            cached[role] = (
+                role_config.get("temperature", default_temperature),
+                role_config.get("description", default_system),
+                model_tiers.get(ROLE_TIERS[role]) or self.role_service_mapping.get(role)
+            )
+        return cached
+    
+    def _role_messages(self,
+                       role: str,
+                       prompt: str,
+                       history: List[Dict[str, str]] = None) -> Tuple[List[Dict[str, str]], float, Optional[str]]:
+        """
+        构建角色的消息列表
+        
+        Args:
+            role: 模型角色
+            prompt: 用户提示词
+            history: 插入在系统角色与提示词之间的对话历史
+            
+        Returns:
+            (消息列表, 温度参数, 服务名称)
+        """
+        temperature, system_role, service_name = self._role_cached[role]
+        
+        messages = [{"role": "system", "content": system_role}]
+        if history:
+            messages.extend(history)
+        messages.append({"role": "user", "content": prompt})
+        
+        return messages, temperature, service_name
+    
+    def _call_role(self,
+                   role: str,
+                   prompt: str,
+                   *,
+                   max_tokens: int,
+                   history: List[Dict[str, str]] = None,
+                   temperature: float = None,
+                   error_prefix: str = None,
+                   use_cache: bool = True) -> str:
+        """
+        以指定角色调用AI服务
+        
+        Args:
+            role: 模型角色
+            prompt: 用户提示词
+            max_tokens: 最大token数
+            history: 对话历史
+            temperature: 温度参数，为None时使用角色配置
+            error_prefix: 调用失败时返回的错误前缀，为None时直接抛出异常
+            use_cache: 是否使用响应缓存
+            
+        Returns:
+            模型响应文本
+        """
+        messages, role_temperature, service_name = self._role_messages(role, prompt, history)
+        if temperature is None:
+            temperature = role_temperature
+        
+        cache_key = self._response_key(messages, service_name, temperature, max_tokens)
+        if use_cache:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response = self.service_manager.chat(
+                messages=messages,
+                service_name=service_name,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            self._response_cache.set(cache_key, response)
+            return response
+        except Exception as e:
+            if error_prefix is None:
+                raise
+            return f"{error_prefix}: {str(e)}"
+    
+    async def _acall_role(self,
+                          role: str,
+                          prompt: str,
+                          *,
+                          max_tokens: int,
+                          history: List[Dict[str, str]] = None,
+                          temperature: float = None,
+                          error_prefix: str = None,
+                          use_cache: bool = True) -> str:
+        """_call_role的异步版本"""
+        messages, role_temperature, service_name = self._role_messages(role, prompt, history)
+        if temperature is None:
+            temperature = role_temperature
+        
+        cache_key = self._response_key(messages, service_name, temperature, max_tokens)
+        if use_cache:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            response = await self.service_manager.achat(
+                messages=messages,
+                service_name=service_name,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            self._response_cache.set(cache_key, response)
+            return response
+        except Exception as e:
+            if error_prefix is None:
+                raise
+            return f"{error_prefix}: {str(e)}"
+    
+    @staticmethod
+    def _response_key(messages: List[Dict[str, str]],
+                      service_name: Optional[str],
+                      temperature: float,
+                      max_tokens: int) -> bytes:
+        """计算角色调用的响应缓存键"""
+        payload = orjson.dumps([messages, service_name, temperature, max_tokens])
+        return hashlib.blake2b(payload, digest_size=16).digest()
+    
+    def collect_information(self,
                           current_stage: str,
                           collected_info: Dict[str, Any],
                           conversation_history: List[Dict[str, str]] = None) -> str:
@@ -76,54 +302,98 @@ class MultiModelCollaborationEngine:
         Args:
             current_stage: 当前阶段
             collected_info: 已收集的信息
-            conversation_history: 对话历史
+            conversation_history: 对话历史，超过COLLECTION_HISTORY_LIMIT条时只保留最近的部分
             
         Returns:
             引导性问题或反馈
         """
-        # 获取角色配置
-        role_config = self.role_config.get(ModelRole.INFORMATION_COLLECTOR, {})
-        temperature = role_config.get("temperature", 0.7)
-        
-        # 构建提示词
-        collected_info_text = self._format_collected_info(collected_info)
-        prompt = PromptTemplates.get_model_collaboration_prompt(
+        return self._call_role(
             ModelRole.INFORMATION_COLLECTOR,
-            collected_info=collected_info_text,
-            current_stage=current_stage
+            self._collection_prompt(current_stage, collected_info),
+            max_tokens=2000,
+            history=self._recent_history(conversation_history),
+            error_prefix="信息收集失败"
         )
+    
+    async def collect_information_async(self,
+                                        current_stage: str,
+                                        collected_info: Dict[str, Any],
+                                        conversation_history: List[Dict[str, str]] = None) -> str:
+        """信息收集角色的异步版本"""
+        return await self._acall_role(
+            ModelRole.INFORMATION_COLLECTOR,
+            self._collection_prompt(current_stage, collected_info),
+            max_tokens=2000,
+            history=self._recent_history(conversation_history),
+            error_prefix="信息收集失败"
+        )
+    
+    def collect_information_stream(self,
+                                   current_stage: str,
+                                   collected_info: Dict[str, Any],
+                                   conversation_history: List[Dict[str, str]] = None) -> Iterator[str]:
+        """
+        信息收集角色的流式版本
         
-        # 构建消息
-        messages = []
-        
-        # 添加系统角色
-        system_role = role_config.get("description", "信息收集专家")
-        messages.append({"role": "system", "content": system_role})
-        
-        # 添加对话历史（如果有）
-        if conversation_history:
-            messages.extend(conversation_history[-6:])  # 只保留最近3轮对话
-        
-        # 添加当前提示
-        messages.append({"role": "user", "content": prompt})
+        Args:
+            current_stage: 当前阶段
+            collected_info: 已收集的信息
+            conversation_history: 对话历史，超过COLLECTION_HISTORY_LIMIT条时只保留最近的部分
+            
+        Yields:
+            引导性问题或反馈的文本片段
+        """
+        messages, temperature, service_name = self._role_messages(
+            ModelRole.INFORMATION_COLLECTOR,
+            self._collection_prompt(current_stage, collected_info),
+            self._recent_history(conversation_history)
+        )
         
         # 调用AI服务
-        service_name = self.role_service_mapping.get(ModelRole.INFORMATION_COLLECTOR)
         try:
-            response = self.service_manager.chat(
+            yield from self.service_manager.chat_stream(
                 messages=messages,
                 service_name=service_name,
                 temperature=temperature,
                 max_tokens=2000
             )
-            return response
         except Exception as e:
-            return f"信息收集失败: {str(e)}"
+            yield f"信息收集失败: {str(e)}"
     
+    @staticmethod
+    def _recent_history(conversation_history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        """限制对话历史的长度，调用方已按上限截取时直接返回原列表"""
+        if not conversation_history or len(conversation_history) <= COLLECTION_HISTORY_LIMIT:
+            return conversation_history or []
+        return conversation_history[-COLLECTION_HISTORY_LIMIT:]
+    
+    def _collection_prompt(self, current_stage: str, collected_info: Dict[str, Any]) -> str:
+        """构建信息收集角色的提示词"""
+        # 首轮对话尚无任何信息，提示词只取决于阶段，直接复用
+        if not collected_info or not any(collected_info.values()):
+            key = (ModelRole.INFORMATION_COLLECTOR, current_stage)
+            prompt = _EMPTY_INFO_PROMPTS.get(key)
+            if prompt is None:
+                prompt = _EMPTY_INFO_PROMPTS[key] = PromptTemplates.get_model_collaboration_prompt(
+                    ModelRole.INFORMATION_COLLECTOR,
+                    collected_info=self._format_collected_info({}),
+                    current_stage=current_stage
+                )
+            return prompt
+        
+        collected_info_text = self._format_collected_info(collected_info)
+        return PromptTemplates.get_model_collaboration_prompt(
+            ModelRole.INFORMATION_COLLECTOR,
+            collected_info=collected_info_text,
+            current_stage=current_stage
+        )
+        
     def generate_content(self,
                         section: str,
                         collected_info: Dict[str, Any],
-                        requirements: str = "") -> str:
+                        requirements: str = "",
+                        use_cache: bool = True,
+                        collected_info_text: Optional[str] = None) -> str:
         """
         内容生成角色：基于收集的信息生成论文内容
         
@@ -131,87 +401,192 @@ class MultiModelCollaborationEngine:
             section: 论文章节
             collected_info: 已收集的信息
             requirements: 额外要求
+            use_cache: 是否使用响应缓存
+            collected_info_text: 预先格式化的已收集信息，为None时现场格式化
             
         Returns:
             生成的内容
         """
-        # 获取角色配置
-        role_config = self.role_config.get(ModelRole.CONTENT_GENERATOR, {})
-        temperature = role_config.get("temperature", 0.8)
+        return self._call_role(
+            ModelRole.CONTENT_GENERATOR,
+            self._generation_prompt(section, collected_info, requirements, collected_info_text),
+            max_tokens=4000,
+            error_prefix="内容生成失败",
+            use_cache=use_cache
+        )
+    
+    async def generate_content_async(self,
+                                     section: str,
+                                     collected_info: Dict[str, Any],
+                                     requirements: str = "",
+                                     use_cache: bool = True,
+                                     collected_info_text: Optional[str] = None) -> str:
+        """内容生成角色的异步版本"""
+        return await self._acall_role(
+            ModelRole.CONTENT_GENERATOR,
+            self._generation_prompt(section, collected_info, requirements, collected_info_text),
+            max_tokens=4000,
+            error_prefix="内容生成失败",
+            use_cache=use_cache
+        )
+    
+    def generate_sections(self,
+                          sections: List[str],
+                          collected_info: Dict[str, Any],
+                          single_request: bool = False,
+                          collected_info_text: Optional[str] = None) -> Dict[str, str]:
+        """
+        内容生成角色：一次性批量生成多个章节的初稿
         
-        # 构建提示词
-        collected_info_text = self._format_collected_info(collected_info)
+        各章节请求通过服务的批量接口并发发送，不经过审核与优化迭代。
+        single_request为True时先尝试在一次请求中以JSON对象生成全部章节，
+        解析失败或缺少的章节再回退到批量接口逐章节生成。
+        
+        Args:
+            sections: 论文章节列表
+            collected_info: 已收集的信息
+            single_request: 是否先尝试单次请求生成全部章节
+            collected_info_text: 预先格式化的已收集信息，为None时现场格式化
+            
+        Returns:
+            章节到生成内容的映射
+        """
+        info_text = collected_info_text
+        if info_text is None:
+            info_text = PromptTemplates._format_collected_info(collected_info)
         
-        # 获取章节生成模板
-        prompt = PromptTemplates.get_content_generation_prompt(section, collected_info)
+        combined = self._generate_sections_combined(sections, collected_info, info_text) if single_request else {}
+        missing = [section for section in sections if section not in combined]
+        if not missing:
+            return combined
         
-        if requirements:
-            prompt += f"\n\n额外要求：\n{requirements}"
+        generated = self._generate_sections_batch(missing, collected_info, info_text)
+        return {section: combined.get(section) or generated[section] for section in sections}
+    
+    def _generate_sections_combined(self,
+                                    sections: List[str],
+                                    collected_info: Dict[str, Any],
+                                    info_text: str) -> Dict[str, str]:
+        """
+        在一次请求中生成全部章节，模型按要求输出以章节为键的JSON对象
         
-        # 构建消息
-        messages = []
+        Returns:
+            成功解析出的章节内容，请求或解析失败时返回空字典
+        """
+        try:
+            response = self._call_role(
+                ModelRole.CONTENT_GENERATOR,
+                PromptTemplates.get_all_sections_prompt(sections, collected_info, info_text),
+                max_tokens=COMBINED_MAX_TOKENS
+            )
+        except Exception as e:
+            print(f"单次请求生成全部章节失败，改为逐章节生成: {str(e)}")
+            return {}
         
-        # 添加系统角色
-        system_role = role_config.get("description", "内容生成专家")
-        messages.append({"role": "system", "content": system_role})
+        # 模型可能在JSON前后附带说明文字或代码块标记，只取最外层的对象
+        start, end = response.find("{"), response.rfind("}")
+        try:
+            data = orjson.loads(response[start:end + 1]) if start != -1 and end > start else None
+        except orjson.JSONDecodeError:
+            data = None
         
-        # 添加生成请求
-        messages.append({"role": "user", "content": prompt})
+        if not isinstance(data, dict):
+            print("单次请求生成全部章节的结果不是有效的JSON，改为逐章节生成")
+            return {}
+        
+        return {
+            section: data[section]
+            for section in sections
+            if isinstance(data.get(section), str) and data[section].strip()
+        }
+    
+    def _generate_sections_batch(self,
+                                 sections: List[str],
+                                 collected_info: Dict[str, Any],
+                                 info_text: str) -> Dict[str, str]:
+        """通过服务的批量接口逐章节并发生成"""
+        temperature, _, service_name = self._role_cached[ModelRole.CONTENT_GENERATOR]
+        batches = [
+            self._role_messages(
+                ModelRole.CONTENT_GENERATOR,
+                self._generation_prompt(section, collected_info, collected_info_text=info_text)
+            )[0]
+            for section in sections
+        ]
         
-        # 调用AI服务
-        service_name = self.role_service_mapping.get(ModelRole.CONTENT_GENERATOR)
         try:
-            response = self.service_manager.chat(
-                messages=messages,
+            results = self.service_manager.chat_batch(
+                batches,
                 service_name=service_name,
                 temperature=temperature,
                 max_tokens=4000
             )
-            return response
         except Exception as e:
-            return f"内容生成失败: {str(e)}"
+            results = [e] * len(sections)
+        
+        return {
+            section: f"内容生成失败: {str(result)}" if isinstance(result, Exception) else result
+            for section, result in zip(sections, results)
+        }
+    
+    def _generation_prompt(self,
+                           section: str,
+                           collected_info: Dict[str, Any],
+                           requirements: str = "",
+                           collected_info_text: Optional[str] = None) -> str:
+        """构建内容生成角色的提示词"""
+        # 获取章节生成模板；没有任何已收集信息时复用按章节缓存的提示词
+        if collected_info_text is None and (not collected_info or not any(collected_info.values())):
+            key = (ModelRole.CONTENT_GENERATOR, section)
+            prompt = _EMPTY_INFO_PROMPTS.get(key)
+            if prompt is None:
+                prompt = _EMPTY_INFO_PROMPTS[key] = PromptTemplates.get_content_generation_prompt(section, {})
+        else:
+            prompt = PromptTemplates.get_content_generation_prompt(section, collected_info, collected_info_text)
+        
+        if requirements:
+            prompt += f"\n\n额外要求：\n{requirements}"
+        
+        return prompt
     
-    def review_quality(self, content: str, section: str = "") -> Dict[str, Any]:
+    def review_quality(self, content: str, section: str = "", use_cache: bool = True) -> Dict[str, Any]:
         """
         质量审核角色：审核内容质量并提供改进建议
         
         Args:
             content: 待审核内容
             section: 内容所属章节
+            use_cache: 是否使用响应缓存
             
         Returns:
             审核结果，包含评分和建议
         """
-        # 获取角色配置
-        role_config = self.role_config.get(ModelRole.QUALITY_REVIEWER, {})
-        temperature = role_config.get("temperature", 0.3)
-        
-        # 构建提示词
-        prompt = PromptTemplates.get_quality_review_prompt(content)
-        
-        if section:
-            prompt = f"请审核以下论文{section}部分的内容：\n\n" + prompt
-        
-        # 构建消息
-        messages = []
-        
-        # 添加系统角色
-        system_role = role_config.get("description", "质量审核专家")
-        messages.append({"role": "system", "content": system_role})
-        
-        # 添加审核请求
-        messages.append({"role": "user", "content": prompt})
-        
-        # 调用AI服务
-        service_name = self.role_service_mapping.get(ModelRole.QUALITY_REVIEWER)
         try:
-            response = self.service_manager.chat(
-                messages=messages,
-                service_name=service_name,
-                temperature=temperature,
-                max_tokens=3000
+            response = self._call_role(
+                ModelRole.QUALITY_REVIEWER,
+                self._review_prompt(content, section),
+                max_tokens=3000,
+                use_cache=use_cache
+            )
+            return {
+                "review": response,
+                "status": "success"
+            }
+        except Exception as e:
+            return {
+                "review": f"审核失败: {str(e)}",
+                "status": "error"
+            }
+    
+    async def review_quality_async(self, content: str, section: str = "", use_cache: bool = True) -> Dict[str, Any]:
+        """质量审核角色的异步版本"""
+        try:
+            response = await self._acall_role(
+                ModelRole.QUALITY_REVIEWER,
+                self._review_prompt(content, section),
+                max_tokens=3000,
+                use_cache=use_cache
             )
-            
             return {
                 "review": response,
                 "status": "success"
@@ -222,54 +597,60 @@ class MultiModelCollaborationEngine:
                 "status": "error"
             }
     
-    def optimize_structure(self, content: str, section: str = "") -> str:
+    def _review_prompt(self, content: str, section: str = "") -> str:
+        """构建质量审核角色的提示词"""
+        prompt = PromptTemplates.get_quality_review_prompt(content)
+        
+        if section:
+            prompt = f"请审核以下论文{section}部分的内容：\n\n" + prompt
+        
+        return prompt
+    
+    def optimize_structure(self, content: str, section: str = "", use_cache: bool = True) -> str:
         """
         结构优化角色：优化内容结构和逻辑
         
         Args:
             content: 待优化内容
             section: 内容所属章节
+            use_cache: 是否使用响应缓存
             
         Returns:
             优化建议或优化后的内容
         """
-        # 获取角色配置
-        role_config = self.role_config.get(ModelRole.STRUCTURE_OPTIMIZER, {})
-        temperature = role_config.get("temperature", 0.5)
+        return self._call_role(
+            ModelRole.STRUCTURE_OPTIMIZER,
+            self._optimization_prompt(content, section),
+            max_tokens=4000,
+            error_prefix="结构优化失败",
+            use_cache=use_cache
+        )
+    
+    async def optimize_structure_async(self, content: str, section: str = "", use_cache: bool = True) -> str:
+        """结构优化角色的异步版本"""
+        return await self._acall_role(
+            ModelRole.STRUCTURE_OPTIMIZER,
+            self._optimization_prompt(content, section),
+            max_tokens=4000,
+            error_prefix="结构优化失败",
+            use_cache=use_cache
+        )
         
-        # 构建提示词
+    def _optimization_prompt(self, content: str, section: str = "") -> str:
+        """构建结构优化角色的提示词"""
         prompt = PromptTemplates.get_structure_optimization_prompt(content)
         
         if section:
             prompt = f"请优化以下论文{section}部分的结构：\n\n" + prompt
         
-        # 构建消息
-        messages = []
-        
-        # 添加系统角色
-        system_role = role_config.get("description", "结构优化专家")
-        messages.append({"role": "system", "content": system_role})
-        
-        # 添加优化请求
-        messages.append({"role": "user", "content": prompt})
-        
-        # 调用AI服务
-        service_name = self.role_service_mapping.get(ModelRole.STRUCTURE_OPTIMIZER)
-        try:
-            response = self.service_manager.chat(
-                messages=messages,
-                service_name=service_name,
-                temperature=temperature,
-                max_tokens=4000
-            )
-            return response
-        except Exception as e:
-            return f"结构优化失败: {str(e)}"
+        return prompt
     
     def collaborative_generation(self,
                                 section: str,
                                 collected_info: Dict[str, Any],
-                                iterations: int = 2) -> Dict[str, Any]:
+                                iterations: int = 2,
+                                use_cache: bool = True,
+                                collected_info_text: Optional[str] = None) -> Dict[str, Any]:
         """
         协作生成：多个角色协作生成高质量内容
         
@@ -277,6 +658,102 @@ class MultiModelCollaborationEngine:
             section: 论文章节
             collected_info: 已收集的信息
             iterations: 迭代次数
+            use_cache: 是否使用响应缓存，重新生成时应关闭以获得新的内容
+            collected_info_text: 预先格式化的已收集信息，为None时现场格式化
+            
+        Returns:
+            生成结果，包含最终内容和过程记录
+        """
+        return run_sync(self.collaborative_generation_async(
+            section, collected_info, iterations, use_cache, collected_info_text
+        ))
+    
+    def collaborative_generation_stream(self,
+                                        sections: List[str],
+                                        collected_info: Dict[str, Any],
+                                        iterations: int = 2,
+                                        collected_info_text: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式批量协作生成：各章节并发执行，按完成顺序逐个返回
+        
+        Args:
+            sections: 论文章节列表
+            collected_info: 已收集的信息
+            iterations: 迭代次数
+            collected_info_text: 预先格式化的已收集信息，为None时现场格式化
+            
+        Yields:
+            (章节, 生成结果)
+        """
+        if not sections:
+            return iter(())
+        
+        return iter_sync(self.collaborative_generation_stream_async(
+            sections, collected_info, iterations, collected_info_text
+        ))
+    
+    async def collaborative_generation_stream_async(self,
+                                                    sections: List[str],
+                                                    collected_info: Dict[str, Any],
+                                                    iterations: int = 2,
+                                                    collected_info_text: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式批量协作生成的异步实现
+        
+        所有章节在同一个事件循环中并发执行，同时进行的章节数不超过max_concurrent_sections，
+        各服务的请求并发上限由服务自身的信号量保证；每个章节完成后立即产出，无需等待其余章节。
+        
+        Args:
+            sections: 论文章节列表
+            collected_info: 已收集的信息
+            iterations: 迭代次数
+            collected_info_text: 预先格式化的已收集信息，为None时现场格式化
+            
+        Yields:
+            (章节, 生成结果)，按完成顺序
+        """
+        # 已收集信息在各章节间共享，只格式化一次
+        info_text = collected_info_text
+        if info_text is None:
+            info_text = PromptTemplates._format_collected_info(collected_info)
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrent_sections))
+        
+        async def generate(section: str) -> Tuple[str, Dict[str, Any]]:
+            async with semaphore:
+                return section, await self.collaborative_generation_async(
+                    section, collected_info, iterations, collected_info_text=info_text
+                )
+        
+        tasks = [asyncio.ensure_future(generate(section)) for section in sections]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # 调用方提前关闭生成器或被取消时（如SSE客户端断开），取消尚未完成的章节，不再继续调用模型
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def collaborative_generation_async(self,
+                                             section: str,
+                                             collected_info: Dict[str, Any],
+                                             iterations: int = 2,
+                                             use_cache: bool = True,
+                                             collected_info_text: Optional[str] = None) -> Dict[str, Any]:
+        """
+        协作生成的异步实现
+        
+        每轮迭代中质量审核与结构优化互不依赖，两者并发执行，
+        再由内容生成角色根据两者的结果改进内容。
+        
+        Args:
+            section: 论文章节
+            collected_info: 已收集的信息
+            iterations: 迭代次数
+            use_cache: 是否使用响应缓存
+            collected_info_text: 预先格式化的已收集信息，为None时现场格式化
             
         Returns:
             生成结果，包含最终内容和过程记录
@@ -287,11 +764,14 @@ class MultiModelCollaborationEngine:
             "iterations": [],
             "status": "success"
         }
+        current_content = ""
         
         try:
             # 第一步：生成初始内容
             print(f"生成{section}初始内容...")
-            initial_content = self.generate_content(section, collected_info)
+            initial_content = await self.generate_content_async(
+                section, collected_info, use_cache=use_cache, collected_info_text=collected_info_text
+            )
             
             current_content = initial_content
             result["iterations"].append({
@@ -304,16 +784,16 @@ class MultiModelCollaborationEngine:
             for i in range(iterations):
                 print(f"第{i+1}轮优化...")
                 
-                # 第二步：质量审核
-                review_result = self.review_quality(current_content, section)
+                # 第二、三步：质量审核与结构优化并发执行
+                review_result, optimized_content = await asyncio.gather(
+                    self.review_quality_async(current_content, section, use_cache),
+                    self.optimize_structure_async(current_content, section, use_cache)
+                )
                 result["iterations"].append({
                     "iteration": i + 1,
                     "type": "quality_review",
                     "content": review_result["review"]
                 })
-                
-                # 第三步：结构优化
-                optimized_content = self.optimize_structure(current_content, section)
                 result["iterations"].append({
                     "iteration": i + 1,
                     "type": "structure_optimization",
@@ -321,33 +801,12 @@ class MultiModelCollaborationEngine:
                 })
                 
                 # 第四步：根据审核意见重新生成
-                improvement_prompt = f"""
-基于以下审核意见和优化建议，改进内容：
-
-原始内容：
-{current_content}
-
-审核意见：
-{review_result['review']}
-
-优化建议：
-{optimized_content}
-
-请生成改进后的内容：
-"""
-                
-                role_config = self.role_config.get(ModelRole.CONTENT_GENERATOR, {})
-                messages = [
-                    {"role": "system", "content": role_config.get("description", "内容生成专家")},
-                    {"role": "user", "content": improvement_prompt}
-                ]
-                
-                service_name = self.role_service_mapping.get(ModelRole.CONTENT_GENERATOR)
-                improved_content = self.service_manager.chat(
-                    messages=messages,
-                    service_name=service_name,
+                improved_content = await self._acall_role(
+                    ModelRole.CONTENT_GENERATOR,
+                    self._improvement_prompt(current_content, review_result["review"], optimized_content),
+                    max_tokens=4000,
                     temperature=0.7,
-                    max_tokens=4000
+                    use_cache=use_cache
                 )
                 
                 current_content = improved_content
@@ -362,10 +821,27 @@ class MultiModelCollaborationEngine:
         except Exception as e:
             result["status"] = "error"
             result["error"] = str(e)
-            result["final_content"] = current_content if 'current_content' in locals() else ""
+            result["final_content"] = current_content
         
         return result
     
+    def _improvement_prompt(self, current_content: str, review: str, optimized_content: str) -> str:
+        """构建根据审核意见和优化建议改进内容的提示词"""
+        return f"""
+基于以下审核意见和优化建议，改进内容：
+
+原始内容：
+{current_content}
+
+审核意见：
+{review}
+
+优化建议：
+{optimized_content}
+
+请生成改进后的内容：
+"""
+    
     def _format_collected_info(self, collected_info: Dict[str, Any]) -> str:
         """格式化已收集的信息"""
         if not collected_info:
@@ -387,5 +863,23 @@ class MultiModelCollaborationEngine:
         return self.role_service_mapping
 
 
-# 全局多模型协作引擎实例
-collaboration_engine = MultiModelCollaborationEngine()
+# 全局多模型协作引擎实例，首次使用时创建
+_engine: Optional[MultiModelCollaborationEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> MultiModelCollaborationEngine:
+    """
+    获取全局多模型协作引擎实例
+    
+    引擎在首次调用时才创建，仅导入本模块不会解析配置文件。
+    
+    Returns:
+        多模型协作引擎实例
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = MultiModelCollaborationEngine()
+    return _engine
@@ -1,14 +1,34 @@
 """
 多轮对话管理和会话存储
 """
-import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+import orjson
+import atexit
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Iterator, Deque, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
 
 
+# 内存中为每个会话保留的最近消息数，完整历史保存在追加写入的消息日志中
+RECENT_MESSAGES = 50
+
+# 每追加多少条消息才重写一次会话文件
+COMPACT_EVERY = 20
+
+# 保持打开的消息日志文件句柄数上限
+MAX_OPEN_LOGS = 64
+
+# 重建会话索引时并发读取会话文件的线程数上限
+INDEX_REBUILD_WORKERS = 32
+
+# 会话索引变更后延迟写盘的秒数，期间的多次变更合并为一次写入
+INDEX_FLUSH_DELAY = 2.0
+
+
 class MessageRole(Enum):
     """消息角色"""
     SYSTEM = "system"
@@ -16,13 +36,13 @@ class MessageRole(Enum):
     ASSISTANT = "assistant"
 
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     """对话消息"""
     role: str
     content: str
     timestamp: str
-    metadata: Dict[str, Any] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
     
     def to_dict(self) -> Dict:
         """转换为字典"""
@@ -30,67 +50,108 @@ class Message:
             "role": self.role,
             "content": self.content,
             "timestamp": self.timestamp,
-            "metadata": self.metadata or {}
+            "metadata": self.metadata
         }
     
     @staticmethod
     def from_dict(data: Dict) -> 'Message':
         """从字典创建"""
-        return Message(
-            role=data["role"],
-            content=data["content"],
-            timestamp=data["timestamp"],
-            metadata=data.get("metadata", {})
-        )
+        return Message(data["role"], data["content"], data["timestamp"], data.get("metadata") or {})
 
 
-@dataclass
+@dataclass(slots=True)
 class ConversationSession:
-    """对话会话"""
+    """
+    对话会话
+    
+    messages只保留最近RECENT_MESSAGES条消息，message_count为消息总数；
+    updated_at_ts为updated_at对应的时间戳，便于按时间比较而无需解析字符串。
+    info_version在collected_info每次更新时递增，formatted_info缓存 (版本, 格式化文本)，
+    两者只存在于内存中，不写入会话文件。
+    """
     session_id: str
     user_id: str
     title: str
-    messages: List[Message]
+    messages: Deque[Message]
     context: Dict[str, Any]
     created_at: str
     updated_at: str
     status: str  # active, completed, abandoned
+    message_count: int = 0
+    updated_at_ts: float = 0.0
+    info_version: int = 0
+    formatted_info: Optional[Tuple[int, str]] = None
+    
+    def touch(self, moment: datetime = None):
+        """
+        更新会话的更新时间
+        
+        Args:
+            moment: 更新时间，默认为当前时间
+        """
+        moment = moment or datetime.now()
+        self.updated_at = moment.isoformat()
+        self.updated_at_ts = moment.timestamp()
     
     def to_dict(self) -> Dict:
-        """转换为字典"""
+        """转换为字典（不含消息，消息单独保存在消息日志中）"""
         return {
             "session_id": self.session_id,
             "user_id": self.user_id,
             "title": self.title,
-            "messages": [msg.to_dict() for msg in self.messages],
             "context": self.context,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
-            "status": self.status
+            "status": self.status,
+            "message_count": self.message_count,
+            "updated_at_ts": self.updated_at_ts
         }
     
     @staticmethod
-    def from_dict(data: Dict) -> 'ConversationSession':
+    def from_dict(data: Dict, messages: List[Message] = None) -> 'ConversationSession':
         """从字典创建"""
         return ConversationSession(
             session_id=data["session_id"],
             user_id=data["user_id"],
             title=data["title"],
-            messages=[Message.from_dict(msg) for msg in data["messages"]],
+            messages=deque(messages or [], maxlen=RECENT_MESSAGES),
             context=data["context"],
             created_at=data["created_at"],
             updated_at=data["updated_at"],
-            status=data["status"]
+            status=data["status"],
+            message_count=data.get("message_count", len(messages or [])),
+            # 旧数据没有时间戳字段，加载时解析一次
+            updated_at_ts=data.get("updated_at_ts") or datetime.fromisoformat(data["updated_at"]).timestamp()
         )
 
 
 class ConversationManager:
     """对话管理器"""
     
+    # 调用模型时携带的对话历史条数上限
+    DEFAULT_CONTEXT_WINDOW = 12
+    
     def __init__(self, storage_path: str = "./data/sessions"):
         self.storage_path = storage_path
         os.makedirs(storage_path, exist_ok=True)
         self.active_sessions: Dict[str, ConversationSession] = {}
+        # 消息日志的打开句柄（LRU）和每个会话尚未写入会话文件的消息数
+        self._log_handles: "OrderedDict[str, Any]" = OrderedDict()
+        self._pending_messages: Dict[str, int] = {}
+        # 每个会话尚未合并进会话文件的上下文补丁数
+        self._pending_patches: Dict[str, int] = {}
+        self._io_lock = threading.Lock()
+        # 每个会话的保存锁：快照、替换会话文件和截断补丁日志必须作为一个整体串行执行
+        self._save_locks: Dict[str, threading.Lock] = {}
+        self._save_locks_guard = threading.Lock()
+        # 会话索引：会话ID -> 会话摘要，避免列出会话时逐个解析会话文件
+        self._index_lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = {}
+        # 索引有未写盘的变更时由定时器延迟写入；写文件锁保证较旧的快照不会覆盖较新的
+        self._index_dirty = False
+        self._index_timer: Optional[threading.Timer] = None
+        self._index_write_lock = threading.Lock()
+        self._index = self._load_index()
     
     def create_session(self, user_id: str, title: str = "新论文项目") -> ConversationSession:
         """
@@ -103,14 +164,15 @@ class ConversationManager:
         Returns:
             会话对象
         """
-        session_id = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        now = datetime.now().isoformat()
+        moment = datetime.now()
+        session_id = f"{user_id}_{moment.strftime('%Y%m%d_%H%M%S')}"
+        now = moment.isoformat()
         
         session = ConversationSession(
             session_id=session_id,
             user_id=user_id,
             title=title,
-            messages=[],
+            messages=deque(maxlen=RECENT_MESSAGES),
             context={
                 "collected_info": {},
                 "current_stage": "initial",
@@ -119,7 +181,8 @@ class ConversationManager:
             },
             created_at=now,
             updated_at=now,
-            status="active"
+            status="active",
+            updated_at_ts=moment.timestamp()
         )
         
         self.active_sessions[session_id] = session
@@ -138,8 +201,9 @@ class ConversationManager:
             会话对象
         """
         # 先从内存中查找
-        if session_id in self.active_sessions:
-            return self.active_sessions[session_id]
+        session = self.active_sessions.get(session_id)
+        if session is not None:
+            return session
         
         # 从磁盘加载
         session = self._load_session(session_id)
@@ -161,21 +225,28 @@ class ConversationManager:
         Returns:
             消息对象
         """
-        session = self.get_session(session_id)
-        if not session:
+        # 热路径：活跃会话直接命中内存，未命中时再走磁盘加载
+        session = self.active_sessions.get(session_id) or self.get_session(session_id)
+        if session is None:
             raise ValueError(f"会话不存在: {session_id}")
         
-        message = Message(
-            role=role,
-            content=content,
-            timestamp=datetime.now().isoformat(),
-            metadata=metadata or {}
-        )
+        moment = datetime.now()
+        now = moment.isoformat()
+        message = Message(role, content, now, metadata or {})
         
+        # 消息追加写入日志；会话文件每COMPACT_EVERY条消息才重写一次，
+        # 中途异常退出时由加载时回放消息日志补齐元数据
+        self._append_message(session_id, message)
         session.messages.append(message)
-        session.updated_at = datetime.now().isoformat()
+        session.message_count += 1
+        session.updated_at = now
+        session.updated_at_ts = moment.timestamp()
         
-        self._save_session(session)
+        pending = self._pending_messages.get(session_id, 0) + 1
+        if pending >= COMPACT_EVERY:
+            self._save_session(session)
+        else:
+            self._pending_messages[session_id] = pending
         
         return message
     
@@ -183,6 +254,8 @@ class ConversationManager:
         """
         获取会话的消息列表
         
+        最近的消息直接从内存返回，超出内存窗口时从消息日志读取完整历史。
+        
         Args:
             session_id: 会话ID
             limit: 限制返回数量
@@ -194,8 +267,15 @@ class ConversationManager:
         if not session:
             return []
         
-        messages = session.messages
-        if limit:
+        if limit is not None and limit <= 0:
+            return []
+        
+        if len(session.messages) >= session.message_count or (limit is not None and limit <= len(session.messages)):
+            messages = list(session.messages)
+        else:
+            messages = self._read_messages(session_id)
+        
+        if limit is not None:
             messages = messages[-limit:]
         
         return messages
@@ -206,12 +286,12 @@ class ConversationManager:
         
         Args:
             session_id: 会话ID
-            limit: 限制返回数量
+            limit: 限制返回数量，默认为DEFAULT_CONTEXT_WINDOW
             
         Returns:
             消息列表 [{"role": "user", "content": "..."}]
         """
-        messages = self.get_messages(session_id, limit)
+        messages = self.get_messages(session_id, limit if limit is not None else self.DEFAULT_CONTEXT_WINDOW)
         return [{"role": msg.role, "content": msg.content} for msg in messages]
     
     def update_context(self, session_id: str, context_updates: Dict[str, Any]):
@@ -227,10 +307,51 @@ class ConversationManager:
             raise ValueError(f"会话不存在: {session_id}")
         
         session.context.update(context_updates)
-        session.updated_at = datetime.now().isoformat()
+        if "collected_info" in context_updates:
+            session.info_version += 1
+        session.touch()
         
         self._save_session(session)
     
+    def merge_context(self, session_id: str, patch: Dict[str, Any], key: str = None):
+        """
+        以增量补丁的方式合并会话上下文
+        
+        补丁追加写入上下文补丁日志，不重写整个会话文件；会话文件每COMPACT_EVERY个补丁
+        才重写一次，加载时按顺序回放补丁日志还原上下文。
+        
+        Args:
+            session_id: 会话ID
+            patch: 需要合并的字段
+            key: 为None时浅合并到上下文顶层，否则浅合并到context[key]字典中
+        """
+        session = self.active_sessions.get(session_id) or self.get_session(session_id)
+        if session is None:
+            raise ValueError(f"会话不存在: {session_id}")
+        if not patch:
+            return
+        
+        session.touch()
+        line = orjson.dumps(
+            {"key": key, "patch": patch, "updated_at": session.updated_at},
+            option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+        )
+        
+        # 内存合并与补丁追加在同一把锁内完成，保证会话快照与补丁日志的偏移一致
+        with self._io_lock:
+            target = session.context if key is None else session.context.setdefault(key, {})
+            target.update(patch)
+            if key == "collected_info" or (key is None and "collected_info" in patch):
+                session.info_version += 1
+            with open(self._context_log_path(session_id), 'ab') as f:
+                f.write(line)
+        
+        pending = self._pending_patches.get(session_id, 0) + 1
+        if pending >= COMPACT_EVERY:
+            self._save_session(session)
+        else:
+            self._pending_patches[session_id] = pending
+    
     def get_context(self, session_id: str) -> Dict[str, Any]:
         """
         获取会话上下文
@@ -260,11 +381,11 @@ class ConversationManager:
             raise ValueError(f"会话不存在: {session_id}")
         
         session.status = status
-        session.updated_at = datetime.now().isoformat()
+        session.touch()
         
         self._save_session(session)
     
-    def list_sessions(self, user_id: str = None) -> List[ConversationSession]:
+    def list_sessions(self, user_id: str = None) -> List[Dict[str, Any]]:
         """
         列出所有会话
         
@@ -272,24 +393,144 @@ class ConversationManager:
             user_id: 用户ID过滤
             
         Returns:
-            会话列表
+            按更新时间倒序排列的会话摘要列表
         """
-        sessions = []
+        with self._index_lock:
+            entries = list(self._index.values())
         
-        for filename in os.listdir(self.storage_path):
-            if filename.endswith('.json'):
-                session_id = filename[:-5]
-                session = self._load_session(session_id)
-                
-                if session:
-                    if user_id is None or session.user_id == user_id:
-                        sessions.append(session)
+        # 内存中的会话可能有尚未写入索引的新消息，以内存为准
+        sessions = [
+            self._summarize(self.active_sessions[entry["session_id"]])
+            if entry["session_id"] in self.active_sessions else entry
+            for entry in entries
+            if user_id is None or entry["user_id"] == user_id
+        ]
         
-        # 按更新时间倒序排列
-        sessions.sort(key=lambda x: x.updated_at, reverse=True)
+        # 按更新时间倒序排列，会话ID保证同一时间戳下顺序稳定
+        sessions.sort(key=self.summary_cursor, reverse=True)
         
         return sessions
     
+    def list_session_summaries(self, user_id: str = None, limit: int = 50,
+                               cursor: str = None) -> Iterator[Dict[str, Any]]:
+        """
+        分页列出会话摘要
+        
+        Args:
+            user_id: 用户ID过滤
+            limit: 每页数量
+            cursor: 上一页最后一项的游标，为None时从第一页开始
+            
+        Returns:
+            按更新时间倒序的会话摘要迭代器
+        """
+        count = 0
+        for summary in self.list_sessions(user_id):
+            if cursor is not None and self.summary_cursor(summary) >= cursor:
+                continue
+            if count >= limit:
+                break
+            count += 1
+            yield summary
+    
+    @staticmethod
+    def summary_cursor(summary: Dict[str, Any]) -> str:
+        """会话摘要的分页游标"""
+        return f"{summary['updated_at']}|{summary['session_id']}"
+    
+    @staticmethod
+    def _summarize(session: ConversationSession) -> Dict[str, Any]:
+        """提取会话摘要"""
+        return {
+            "session_id": session.session_id,
+            "user_id": session.user_id,
+            "title": session.title,
+            "status": session.status,
+            "created_at": session.created_at,
+            "updated_at": session.updated_at,
+            "updated_at_ts": session.updated_at_ts,
+            "message_count": session.message_count
+        }
+    
+    def _index_path(self) -> str:
+        """会话索引文件路径"""
+        return os.path.join(self.storage_path, "index.json")
+    
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        """
+        加载会话索引
+        
+        索引不存在、损坏或早于最新的会话文件（索引延迟写盘期间进程异常退出）时，
+        扫描会话文件重建。
+        """
+        # DirEntry自带文件类型和stat信息，无需逐个os.path.join再stat；
+        # 按修改时间倒序重建，使索引顺序与会话列表顺序大致一致
+        with os.scandir(self.storage_path) as it:
+            entries = [
+                (entry.name[:-5], entry.stat().st_mtime)
+                for entry in it
+                if entry.name.endswith('.json') and entry.name != "index.json" and entry.is_file()
+            ]
+        entries.sort(key=lambda item: item[1], reverse=True)
+        
+        try:
+            if entries and os.stat(self._index_path()).st_mtime < entries[0][1]:
+                print("会话索引早于会话文件，重新构建")
+            else:
+                with open(self._index_path(), 'rb') as f:
+                    return orjson.loads(f.read())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"加载会话索引失败，重新构建: {str(e)}")
+        
+        # 小文件读取以I/O等待为主，多线程并发读取
+        index = {}
+        if entries:
+            session_ids = [session_id for session_id, _ in entries]
+            with ThreadPoolExecutor(max_workers=min(INDEX_REBUILD_WORKERS, len(session_ids))) as executor:
+                for session in executor.map(self._load_session, session_ids):
+                    if session:
+                        index[session.session_id] = self._summarize(session)
+        
+        self._index = index
+        self._write_index()
+        return index
+    
+    def _update_index(self, session: ConversationSession):
+        """更新会话在索引中的摘要，索引文件延迟写入"""
+        with self._index_lock:
+            self._index[session.session_id] = self._summarize(session)
+            self._index_dirty = True
+            if self._index_timer is None:
+                self._index_timer = threading.Timer(INDEX_FLUSH_DELAY, self._flush_index)
+                self._index_timer.daemon = True
+                self._index_timer.start()
+    
+    def _flush_index(self):
+        """索引有未写盘的变更时立即写入，并取消等待中的延迟写入"""
+        with self._index_lock:
+            if self._index_timer is not None:
+                self._index_timer.cancel()
+                self._index_timer = None
+            if not self._index_dirty:
+                return
+        self._write_index()
+    
+    def _write_index(self):
+        """写入会话索引（先写临时文件再替换，避免读到不完整的索引）"""
+        with self._index_write_lock:
+            # 全局索引锁只在序列化快照时持有，写盘期间不阻塞会话保存和列表查询
+            with self._index_lock:
+                data = orjson.dumps(self._index)
+                self._index_dirty = False
+            tmp_path = self._index_path() + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._index_path())
+    
     def delete_session(self, session_id: str):
         """
         删除会话
@@ -300,34 +541,243 @@ class ConversationManager:
         # 从内存中删除
         if session_id in self.active_sessions:
             del self.active_sessions[session_id]
+        self._pending_messages.pop(session_id, None)
+        self._pending_patches.pop(session_id, None)
+        self._close_log(session_id)
+        with self._save_locks_guard:
+            self._save_locks.pop(session_id, None)
         
         # 从磁盘删除
-        file_path = os.path.join(self.storage_path, f"{session_id}.json")
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        for file_path in (self._session_path(session_id),
+                          self._messages_path(session_id),
+                          self._context_log_path(session_id)):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        
+        # 删除操作较少，立即写盘，避免异常退出后索引中残留已删除的会话
+        with self._index_lock:
+            removed = self._index.pop(session_id, None)
+            if removed:
+                self._index_dirty = True
+        if removed:
+            self._flush_index()
+    
+    def _session_path(self, session_id: str) -> str:
+        """会话文件路径"""
+        return os.path.join(self.storage_path, f"{session_id}.json")
+    
+    def _messages_path(self, session_id: str) -> str:
+        """消息日志路径（每行一条JSON消息）"""
+        return os.path.join(self.storage_path, f"{session_id}.jsonl")
+    
+    def _context_log_path(self, session_id: str) -> str:
+        """上下文补丁日志路径（每行一个JSON补丁）"""
+        return os.path.join(self.storage_path, f"{session_id}.context.jsonl")
     
     def _save_session(self, session: ConversationSession):
-        """保存会话到磁盘"""
-        file_path = os.path.join(self.storage_path, f"{session.session_id}.json")
+        """
+        保存会话到磁盘
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(session.to_dict(), f, ensure_ascii=False, indent=2)
+        先写入临时文件并落盘，再原子替换正式文件，写入中途崩溃不会留下不完整的JSON。
+        消息本身在追加写入的消息日志中，因此只有这里需要fsync。
+        写入后丢弃已合并进会话文件的上下文补丁。
+        
+        同一会话的保存在会话级的锁内串行执行：并发保存时较旧的快照不会覆盖较新的快照，
+        截断补丁日志使用的偏移也总是基于当前的日志，不会丢弃尚未写入任何快照的补丁。
+        """
+        file_path = self._session_path(session.session_id)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        context_log = self._context_log_path(session.session_id)
+        
+        with self._save_lock(session.session_id):
+            # 快照与补丁日志偏移在同一把锁内获取，偏移之前的补丁都已包含在快照中
+            with self._io_lock:
+                data = orjson.dumps(session.to_dict(), option=orjson.OPT_NON_STR_KEYS)
+                merged = os.path.getsize(context_log) if os.path.exists(context_log) else 0
+            
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+            
+            if merged:
+                self._truncate_context_log(session.session_id, merged)
+            
+            self._pending_messages.pop(session.session_id, None)
+            self._pending_patches.pop(session.session_id, None)
+            self._update_index(session)
+    
+    def _save_lock(self, session_id: str) -> threading.Lock:
+        """获取会话的保存锁（首次使用时创建）"""
+        with self._save_locks_guard:
+            lock = self._save_locks.get(session_id)
+            if lock is None:
+                lock = self._save_locks[session_id] = threading.Lock()
+            return lock
+    
+    def _truncate_context_log(self, session_id: str, offset: int):
+        """丢弃补丁日志中offset之前的部分，只保留快照之后追加的补丁"""
+        context_log = self._context_log_path(session_id)
+        with self._io_lock:
+            with open(context_log, 'rb') as f:
+                f.seek(offset)
+                remaining = f.read()
+            
+            if not remaining:
+                os.remove(context_log)
+                return
+            
+            tmp_path = f"{context_log}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(remaining)
+            os.replace(tmp_path, context_log)
+    
+    def _append_message(self, session_id: str, message: Message):
+        """追加一条消息到消息日志，复用已打开的文件句柄"""
+        # orjson原生序列化dataclass，无需先构造中间字典
+        line = orjson.dumps(message, option=orjson.OPT_APPEND_NEWLINE)
+        
+        with self._io_lock:
+            handle = self._log_handles.get(session_id)
+            if handle is None:
+                handle = open(self._messages_path(session_id), 'ab')
+                self._log_handles[session_id] = handle
+                while len(self._log_handles) > MAX_OPEN_LOGS:
+                    _, oldest = self._log_handles.popitem(last=False)
+                    oldest.close()
+            else:
+                self._log_handles.move_to_end(session_id)
+            
+            handle.write(line)
+            # 刷新到操作系统，保证随后读取消息日志时可见
+            handle.flush()
+    
+    def _close_log(self, session_id: str):
+        """关闭会话的消息日志句柄"""
+        with self._io_lock:
+            handle = self._log_handles.pop(session_id, None)
+            if handle is not None:
+                handle.close()
+    
+    def flush(self):
+        """将所有有未保存消息或上下文补丁的会话写入会话文件，写入会话索引，并关闭消息日志句柄"""
+        for session_id in set(self._pending_messages) | set(self._pending_patches):
+            session = self.active_sessions.get(session_id)
+            if session:
+                self._save_session(session)
+        
+        # 索引最后写入，使其修改时间不早于会话文件，下次启动无需重建
+        self._flush_index()
+        
+        with self._io_lock:
+            for handle in self._log_handles.values():
+                handle.close()
+            self._log_handles.clear()
+    
+    def _read_messages(self, session_id: str, tail: int = None) -> List[Message]:
+        """
+        从消息日志读取消息
+        
+        Args:
+            session_id: 会话ID
+            tail: 只读取最后若干条，为None时读取全部
+            
+        Returns:
+            消息列表
+        """
+        return self._read_message_log(session_id, tail)[0]
+    
+    def _read_message_log(self, session_id: str, tail: int = None) -> Tuple[List[Message], int]:
+        """
+        从消息日志读取消息，同时统计消息总数
+        
+        Args:
+            session_id: 会话ID
+            tail: 只解析最后若干条，为None时解析全部
+            
+        Returns:
+            (消息列表, 日志中的消息总数)
+        """
+        file_path = self._messages_path(session_id)
+        if not os.path.exists(file_path):
+            return [], 0
+        
+        count = 0
+        lines = deque(maxlen=tail)
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    count += 1
+                    lines.append(line)
+        
+        return [Message.from_dict(orjson.loads(line)) for line in lines], count
     
     def _load_session(self, session_id: str) -> Optional[ConversationSession]:
         """从磁盘加载会话"""
-        file_path = os.path.join(self.storage_path, f"{session_id}.json")
+        file_path = self._session_path(session_id)
         
         if not os.path.exists(file_path):
             return None
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return ConversationSession.from_dict(data)
+            with open(file_path, 'rb') as f:
+                data = orjson.loads(f.read())
+            
+            # 旧格式的会话文件内嵌全部消息，迁移到消息日志
+            if "messages" in data:
+                return self._migrate_session(data)
+            
+            session = ConversationSession.from_dict(data)
+            
+            # 回放消息日志：会话文件可能落后于日志，以日志为准补齐消息数和更新时间
+            messages, count = self._read_message_log(session_id, tail=RECENT_MESSAGES)
+            session.messages.extend(messages)
+            session.message_count = count
+            if messages and messages[-1].timestamp > session.updated_at:
+                session.touch(datetime.fromisoformat(messages[-1].timestamp))
+            
+            # 回放上下文补丁日志，按写入顺序逐个合并
+            self._replay_context_log(session)
+            
+            return session
         except Exception as e:
             print(f"加载会话失败 {session_id}: {str(e)}")
             return None
     
+    def _replay_context_log(self, session: ConversationSession):
+        """将上下文补丁日志中尚未合并进会话文件的补丁应用到会话上下文"""
+        context_log = self._context_log_path(session.session_id)
+        if not os.path.exists(context_log):
+            return
+        
+        updated_at = session.updated_at
+        with open(context_log, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = orjson.loads(line)
+                key = record.get("key")
+                target = session.context if key is None else session.context.setdefault(key, {})
+                target.update(record["patch"])
+                updated_at = max(updated_at, record.get("updated_at", ""))
+        
+        if updated_at > session.updated_at:
+            session.touch(datetime.fromisoformat(updated_at))
+    
+    def _migrate_session(self, data: Dict) -> ConversationSession:
+        """将内嵌消息的旧格式会话拆分为会话文件和消息日志"""
+        messages = [Message.from_dict(msg) for msg in data.pop("messages")]
+        data["message_count"] = len(messages)
+        
+        with open(self._messages_path(data["session_id"]), 'wb') as f:
+            for message in messages:
+                f.write(orjson.dumps(message, option=orjson.OPT_APPEND_NEWLINE))
+        
+        session = ConversationSession.from_dict(data, messages)
+        self._save_session(session)
+        return session
+    
     def clear_old_sessions(self, days: int = 30):
         """
         清理旧会话
@@ -335,15 +785,17 @@ class ConversationManager:
         Args:
             days: 保留天数
         """
-        from datetime import timedelta
-        
-        cutoff_date = datetime.now() - timedelta(days=days)
+        cutoff_ts = (datetime.now() - timedelta(days=days)).timestamp()
         
         for session in self.list_sessions():
-            updated_at = datetime.fromisoformat(session.updated_at)
-            if updated_at < cutoff_date and session.status != "active":
-                self.delete_session(session.session_id)
+            # 旧索引条目没有时间戳字段时才解析字符串
+            updated_at_ts = session.get("updated_at_ts") or datetime.fromisoformat(session["updated_at"]).timestamp()
+            if updated_at_ts < cutoff_ts and session["status"] != "active":
+                self.delete_session(session["session_id"])
 
 
 # 全局对话管理器实例
 conversation_manager = ConversationManager()
+
+# 进程退出时保存尚未写入会话文件的元数据
+atexit.register(conversation_manager.flush)
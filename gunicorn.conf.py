@@ -0,0 +1,21 @@
+"""
+Gunicorn生产环境配置
+
+启动命令: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"0.0.0.0:{os.getenv('FLASK_PORT', 5000)}"
+
+# 接口耗时主要在等待LLM响应，使用线程worker提高并发
+worker_class = "gthread"
+# 会话缓存保存在进程内存中，多个worker进程会各自持有会话副本，默认只启动一个进程
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+threads = int(os.getenv("GUNICORN_THREADS", 32))
+
+# 论文生成可能持续数分钟，超时时间需覆盖单次LLM调用
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 180))
+keepalive = 5
@@ -1,12 +1,38 @@
 """
 论文生成核心逻辑
 """
-import yaml
-from typing import Dict, List, Any, Optional
+import re
+import asyncio
+import hashlib
+import orjson
+from typing import Dict, List, Any, Optional, Iterator, Tuple
 from datetime import datetime
 from conversation_manager import ConversationManager, conversation_manager
-from collaboration_engine import MultiModelCollaborationEngine, collaboration_engine
-from prompt_templates import PromptBuilder, PromptTemplates
+from collaboration_engine import MultiModelCollaborationEngine, get_engine, load_config, COLLECTION_HISTORY_LIMIT
+from prompt_templates import PromptTemplates, prompt_builder
+from semantic_cache import semantic_cache
+
+try:
+    # 可选依赖：修复模型输出中不完整或不规范的JSON
+    import json_repair
+except ImportError:
+    json_repair = None
+
+# 按编号逐条作答的结构化输入，如"1. 研究主题：..."，每行匹配 (字段名, 内容)
+_STRUCTURED_RE = re.compile(r'^\s*\d+[.、．]\s*([^:：\n]+?)\s*[:：]\s*(.+?)\s*$', re.M)
+
+# 结构化输入至少匹配的行数，达到时直接解析而不调用模型
+STRUCTURED_MIN_FIELDS = 2
+
+# 快速路径可以直接返回的字段
+_EXTRACTION_FIELD_SET = frozenset(PromptTemplates.EXTRACTION_FIELDS)
+
+
+def _export_template(header: str, section_format: str, sections: Tuple[Tuple[str, str], ...]) -> str:
+    """将文件头和各章节拼接为整篇导出模板，章节内容以章节键为占位符"""
+    return header + "".join(
+        section_format.format(title=title, content="{" + key + "}") for key, title in sections
+    )
 
 
 class PaperGenerationStage:
@@ -30,22 +56,68 @@ class PaperSection:
     RESULTS = "results"
     DISCUSSION = "discussion"
     CONCLUSION = "conclusion"
+    
+    # 章节生成顺序
+    ORDER = (
+        ABSTRACT,
+        INTRODUCTION,
+        LITERATURE_REVIEW,
+        METHODOLOGY,
+        RESULTS,
+        DISCUSSION,
+        CONCLUSION
+    )
 
 
 class AcademicPaperGenerator:
     """学术论文生成器"""
     
+    # 开始生成论文前必须收集的信息（元组保持提示缺失信息时的顺序，集合用于差集运算）
+    REQUIRED_FIELDS = ("研究主题", "研究背景", "研究目标", "研究方法", "数据来源", "研究发现")
+    _REQUIRED_SET = frozenset(REQUIRED_FIELDS)
+    
+    # 导出时各章节的顺序和标题
+    MARKDOWN_SECTIONS = (
+        ("abstract", "摘要 (Abstract)"),
+        ("introduction", "引言 (Introduction)"),
+        ("literature_review", "文献综述 (Literature Review)"),
+        ("methodology", "研究方法 (Methodology)"),
+        ("results", "研究结果 (Results)"),
+        ("discussion", "讨论 (Discussion)"),
+        ("conclusion", "结论 (Conclusion)")
+    )
+    TEXT_SECTIONS = (
+        ("abstract", "摘要"),
+        ("introduction", "引言"),
+        ("literature_review", "文献综述"),
+        ("methodology", "研究方法"),
+        ("results", "研究结果"),
+        ("discussion", "讨论"),
+        ("conclusion", "结论")
+    )
+    TEXT_RULE = "=" * 60
+    TEXT_SECTION_RULE = "-" * 60
+    
+    # 导出的文件头和章节格式，{_ts}为生成时间
+    MARKDOWN_HEADER = "# 学术论文\n\n生成时间：{_ts}\n\n---\n\n"
+    MARKDOWN_SECTION = "## {title}\n\n{content}\n\n"
+    TEXT_HEADER = TEXT_RULE + "\n学术论文\n生成时间：{_ts}\n" + TEXT_RULE + "\n\n"
+    TEXT_SECTION = "{title}\n" + TEXT_SECTION_RULE + "\n\n{content}\n\n"
+    # 章节齐全时使用的整篇模板
+    MARKDOWN_TEMPLATE = _export_template(MARKDOWN_HEADER, MARKDOWN_SECTION, MARKDOWN_SECTIONS)
+    TEXT_TEMPLATE = _export_template(TEXT_HEADER, TEXT_SECTION, TEXT_SECTIONS)
+    
     def __init__(self, config_path: str = "config.yaml"):
         self.config = self._load_config(config_path)
         self.conversation_manager = conversation_manager
-        self.collaboration_engine = collaboration_engine
-        self.prompt_builder = PromptBuilder()
+        self.prompt_builder = prompt_builder
         
         # 论文生成配置
         self.paper_config = self.config.get("paper_generation", {})
         self.max_rounds = self.paper_config.get("max_rounds", 15)
         self.min_rounds = self.paper_config.get("min_rounds", 5)
         self.sections_config = self.paper_config.get("sections", [])
+        self.single_request_draft = self.paper_config.get("single_request_draft", False)
         
         # 阶段流程定义
         self.stage_flow = [
@@ -57,15 +129,20 @@ class AcademicPaperGenerator:
             PaperGenerationStage.LITERATURE_REVIEW,
             PaperGenerationStage.GENERATING
         ]
+        
+        # 轮次到阶段的映射：超出阶段流程的轮次停留在最后一个阶段，max_rounds之后的轮次在查找时截断
+        self._stage_by_round = tuple(
+            self.stage_flow + [self.stage_flow[-1]] * max(self.max_rounds - len(self.stage_flow) + 1, 0)
+        )
+    
+    @property
+    def collaboration_engine(self) -> MultiModelCollaborationEngine:
+        """多模型协作引擎（首次访问时创建）"""
+        return get_engine()
     
     def _load_config(self, config_path: str) -> Dict:
-        """加载配置文件"""
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
-        except Exception as e:
-            print(f"加载配置文件失败: {str(e)}")
-            return {}
+        """加载配置文件（与协作引擎共用按文件修改时间缓存的解析结果）"""
+        return load_config(config_path)
     
     def start_new_paper(self, user_id: str, title: str = "新论文项目") -> Dict[str, Any]:
         """
@@ -118,30 +195,11 @@ class AcademicPaperGenerator:
         Returns:
             响应信息
         """
-        # 获取会话
-        session = self.conversation_manager.get_session(session_id)
-        if not session:
+        turn = self._prepare_user_turn(session_id, user_input)
+        if turn is None:
             return {"error": "会话不存在"}
         
-        # 添加用户消息
-        self.conversation_manager.add_message(session_id, "user", user_input)
-        
-        # 获取当前上下文
-        context = self.conversation_manager.get_context(session_id)
-        current_stage = context.get("current_stage", PaperGenerationStage.INITIAL)
-        collected_info = context.get("collected_info", {})
-        
-        # 提取用户输入中的信息
-        extracted_info = self._extract_information(user_input, current_stage)
-        collected_info.update(extracted_info)
-        
-        # 更新上下文
-        self.conversation_manager.update_context(session_id, {
-            "collected_info": collected_info
-        })
-        
-        # 获取当前轮次
-        current_round = len(session.messages) // 2
+        current_stage, collected_info, current_round = turn
         
         # 判断是否需要继续收集信息
         if current_round < self.min_rounds:
@@ -153,22 +211,158 @@ class AcademicPaperGenerator:
                 current_round
             )
         else:
-            # 检查信息完整性
-            completeness = self._check_information_completeness(collected_info)
-            
-            if completeness["is_complete"] or current_round >= self.max_rounds:
-                # 信息收集完成，开始生成论文
-                response = self._start_paper_generation(session_id, collected_info)
-            else:
-                # 继续收集缺失信息
-                response = self._collect_missing_information(
-                    session_id,
-                    collected_info,
-                    completeness["missing_info"]
-                )
+            response = self._finish_or_collect_missing(session_id, collected_info, current_round)
         
         return response
     
+    async def process_user_input_async(self, session_id: str, user_input: str) -> Dict[str, Any]:
+        """
+        处理用户输入（异步）
+        
+        信息收集直接使用引擎的异步接口；会话读写、信息提取等同步阻塞调用通过asyncio.to_thread
+        放到线程池执行，不阻塞事件循环，同一个事件循环可以同时处理多个会话。
+        
+        Args:
+            session_id: 会话ID
+            user_input: 用户输入
+            
+        Returns:
+            响应信息
+        """
+        turn = await asyncio.to_thread(self._prepare_user_turn, session_id, user_input)
+        if turn is None:
+            return {"error": "会话不存在"}
+        
+        current_stage, collected_info, current_round = turn
+        
+        if current_round >= self.min_rounds:
+            return await asyncio.to_thread(
+                self._finish_or_collect_missing, session_id, collected_info, current_round
+            )
+        
+        next_stage, conversation_history = await asyncio.to_thread(
+            self._begin_information_collection, session_id, current_round
+        )
+        
+        response_message = await self.collaboration_engine.collect_information_async(
+            current_stage=next_stage,
+            collected_info=collected_info,
+            conversation_history=conversation_history
+        )
+        
+        return await asyncio.to_thread(
+            self._finish_information_collection, session_id, next_stage, response_message, current_round
+        )
+    
+    def process_user_input_stream(self, session_id: str, user_input: str) -> Iterator[Dict[str, Any]]:
+        """
+        处理用户输入（流式）
+        
+        信息收集阶段逐段返回助手回复，其余阶段在处理完成后一次性返回结果。
+        
+        Args:
+            session_id: 会话ID
+            user_input: 用户输入
+            
+        Yields:
+            事件字典：{"type": "delta", "content": "..."}、{"type": "section", "section": "...", "content": "..."}
+            或 {"type": "result", "data": {...}}
+        """
+        turn = self._prepare_user_turn(session_id, user_input)
+        if turn is None:
+            yield {"type": "result", "data": {"error": "会话不存在"}}
+            return
+        
+        current_stage, collected_info, current_round = turn
+        
+        if current_round < self.min_rounds:
+            next_stage, conversation_history = self._begin_information_collection(session_id, current_round)
+            
+            parts = []
+            for chunk in self.collaboration_engine.collect_information_stream(
+                current_stage=next_stage,
+                collected_info=collected_info,
+                conversation_history=conversation_history
+            ):
+                parts.append(chunk)
+                yield {"type": "delta", "content": chunk}
+            
+            response = self._finish_information_collection(
+                session_id, next_stage, "".join(parts), current_round
+            )
+            yield {"type": "result", "data": response}
+        else:
+            # 开始生成论文时每个章节完成即推送
+            yield from self._iter_finish_or_collect_missing(session_id, collected_info, current_round)
+    
+    def _prepare_user_turn(self, session_id: str, user_input: str) -> Optional[Tuple[str, Dict[str, Any], int]]:
+        """
+        记录用户消息并更新已收集的信息
+        
+        Args:
+            session_id: 会话ID
+            user_input: 用户输入
+            
+        Returns:
+            (当前阶段, 已收集信息, 当前轮次)，会话不存在时返回None
+        """
+        # 获取会话
+        session = self.conversation_manager.get_session(session_id)
+        if not session:
+            return None
+        
+        # 添加用户消息
+        self.conversation_manager.add_message(session_id, "user", user_input)
+        
+        # 获取当前上下文
+        context = self.conversation_manager.get_context(session_id)
+        current_stage = context.get("current_stage", PaperGenerationStage.INITIAL)
+        
+        # 提取用户输入中的信息，只将本轮新提取的字段作为补丁合并到上下文
+        extracted_info = self._extract_information(user_input, current_stage)
+        self.conversation_manager.merge_context(session_id, extracted_info, key="collected_info")
+        collected_info = context.setdefault("collected_info", {})
+        
+        # 获取当前轮次
+        current_round = session.message_count // 2
+        
+        return current_stage, collected_info, current_round
+    
+    def _finish_or_collect_missing(self,
+                                   session_id: str,
+                                   collected_info: Dict[str, Any],
+                                   current_round: int) -> Dict[str, Any]:
+        """检查信息完整性，信息充足时生成论文，否则继续收集缺失信息"""
+        return self._last_result(self._iter_finish_or_collect_missing(session_id, collected_info, current_round))
+    
+    def _iter_finish_or_collect_missing(self,
+                                        session_id: str,
+                                        collected_info: Dict[str, Any],
+                                        current_round: int) -> Iterator[Dict[str, Any]]:
+        """_finish_or_collect_missing的流式版本，生成论文时逐章节产出事件"""
+        completeness = self._check_information_completeness(collected_info)
+        
+        if completeness["is_complete"] or current_round >= self.max_rounds:
+            # 信息收集完成，开始生成论文
+            yield from self._iter_paper_generation(session_id, collected_info)
+            return
+        
+        # 继续收集缺失信息
+        yield {"type": "result", "data": self._collect_missing_information(
+            session_id,
+            collected_info,
+            completeness["missing_info"]
+        )}
+    
+    @staticmethod
+    def _last_result(events: Iterator[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """消费事件流，返回最后一个result事件的数据"""
+        result = None
+        for event in events:
+            if event["type"] == "result":
+                result = event["data"]
+        return result
+    
     def _extract_information(self, user_input: str, stage: str) -> Dict[str, Any]:
         """
         从用户输入中提取信息
@@ -180,63 +374,35 @@ class AcademicPaperGenerator:
         Returns:
             提取的信息
         """
-        # 使用AI提取结构化信息
-        extraction_prompt = f"""
-请从以下用户输入中提取学术论文相关的信息，并以结构化方式返回：
-
-用户输入：
-{user_input}
-
-当前阶段：{stage}
-
-请提取以下类型的信息（如果有）：
-- 研究主题
-- 研究背景
-- 研究目标
-- 研究方法
-- 数据来源
-- 研究发现
-- 理论基础
-- 文献引用
-- 研究问题
-- 研究意义
-- 研究局限
-- 未来方向
-
-请以JSON格式返回提取的信息，例如：
-{{
-    "研究主题": "...",
-    "研究背景": "...",
-    ...
-}}
-
-如果某项信息不存在，请忽略该字段。
-"""
-        
+        # 快速路径：按编号逐条回答引导问题时直接解析，无需调用模型
+        structured = self._parse_structured_answer(user_input)
+        if structured is not None:
+            return structured
+        
+        # 语义缓存：同一阶段下近似重复的输入（重试、错别字、常见表述）直接复用提取结果
+        cache_namespace = f"extraction|{stage}"
+        if semantic_cache is not None:
+            cached = semantic_cache.lookup(user_input, cache_namespace)
+            if cached is not None:
+                return orjson.loads(cached)
+        
+        # 使用AI提取结构化信息：固定的提取说明作为系统消息放在最前，
+        # 用户消息只包含阶段和输入，各轮请求共享相同的前缀
         try:
             messages = [
-                {"role": "system", "content": "你是信息提取专家，擅长从文本中提取结构化信息。"},
-                {"role": "user", "content": extraction_prompt}
+                {"role": "system", "content": PromptTemplates.INFORMATION_EXTRACTION},
+                {"role": "user", "content": PromptTemplates.INFORMATION_EXTRACTION_INPUT.format(
+                    stage=stage,
+                    user_input=user_input
+                )}
             ]
             
-            response = self.collaboration_engine.service_manager.chat(
-                messages=messages,
-                temperature=0.3,
-                max_tokens=1000
-            )
-            
-            # 尝试解析JSON
-            import json
-            import re
-            
-            # 查找JSON块
-            json_match = re.search(r'\{[^}]+\}', response, re.DOTALL)
-            if json_match:
-                try:
-                    extracted = json.loads(json_match.group())
-                    return extracted
-                except:
-                    pass
+            response = self._request_extraction(messages)
+            extracted = self._parse_extraction(response)
+            if extracted is not None:
+                if semantic_cache is not None:
+                    semantic_cache.add(user_input, orjson.dumps(extracted).decode('utf-8'), cache_namespace)
+                return extracted
             
             # 如果无法解析JSON，返回原始输入作为"用户补充信息"
             return {"用户补充信息": user_input}
@@ -245,6 +411,83 @@ class AcademicPaperGenerator:
             print(f"信息提取失败: {str(e)}")
             return {"用户补充信息": user_input}
     
+    @staticmethod
+    def _parse_structured_answer(user_input: str) -> Optional[Dict[str, Any]]:
+        """
+        解析按编号逐条作答的结构化输入
+        
+        Args:
+            user_input: 用户输入
+            
+        标签先按PromptTemplates.EXTRACTION_FIELD_ALIASES归一化为提取字段，多个标签对应同一字段时
+        内容合并；存在无法归一化的标签时交给模型提取，保证字段名与信息完整性检查一致。
+        
+        Returns:
+            字段名到内容的映射，解析出的字段少于STRUCTURED_MIN_FIELDS或含未知字段时返回None
+        """
+        matches = _STRUCTURED_RE.findall(user_input)
+        if len(matches) < STRUCTURED_MIN_FIELDS:
+            return None
+        
+        fields: Dict[str, str] = {}
+        for label, value in matches:
+            label = label.strip("*# ")
+            field = PromptTemplates.EXTRACTION_FIELD_ALIASES.get(label, label)
+            if field not in _EXTRACTION_FIELD_SET:
+                return None
+            fields[field] = f"{fields[field]}\n{value}" if field in fields else value
+        
+        return fields if len(fields) >= STRUCTURED_MIN_FIELDS else None
+    
+    def _request_extraction(self, messages: List[Dict[str, str]]) -> str:
+        """
+        调用模型提取信息，优先使用服务的JSON模式保证输出为合法JSON
+        
+        信息提取只是把用户输入整理为JSON字段，使用small档位的模型（未配置时为默认服务）。
+        
+        Args:
+            messages: 消息列表
+            
+        Returns:
+            模型响应文本
+        """
+        service_manager = self.collaboration_engine.service_manager
+        try:
+            return service_manager.chat(messages=messages, temperature=0.3, max_tokens=1000,
+                                        json_mode=True, model_tier="small")
+        except Exception as e:
+            # 部分兼容OpenAI格式的服务不支持response_format，退回普通模式
+            print(f"JSON模式调用失败，改用普通模式: {str(e)}")
+            return service_manager.chat(messages=messages, temperature=0.3, max_tokens=1000, model_tier="small")
+    
+    @staticmethod
+    def _parse_extraction(response: str) -> Optional[Dict[str, Any]]:
+        """
+        解析信息提取结果
+        
+        JSON模式下响应本身就是JSON；解析失败时（服务不支持JSON模式）用json_repair修复，
+        未安装json_repair时取最外层的花括号内容再解析一次。
+        
+        Args:
+            response: 模型响应文本
+            
+        Returns:
+            提取的信息，无法解析时返回None
+        """
+        try:
+            extracted = orjson.loads(response)
+        except orjson.JSONDecodeError:
+            if json_repair is not None:
+                extracted = json_repair.loads(response)
+            else:
+                start, end = response.find("{"), response.rfind("}")
+                try:
+                    extracted = orjson.loads(response[start:end + 1]) if start != -1 and end > start else None
+                except orjson.JSONDecodeError:
+                    return None
+        
+        return extracted if isinstance(extracted, dict) and extracted else None
+    
     def _check_information_completeness(self, collected_info: Dict[str, Any]) -> Dict[str, Any]:
         """
         检查收集信息的完整性
@@ -255,20 +498,14 @@ class AcademicPaperGenerator:
         Returns:
             完整性检查结果
         """
-        required_fields = [
-            "研究主题", "研究背景", "研究目标", "研究方法",
-            "数据来源", "研究发现"
-        ]
-        
-        missing_info = []
-        for field in required_fields:
-            if field not in collected_info or not collected_info[field]:
-                missing_info.append(field)
+        present = {key for key, value in collected_info.items() if value}
+        missing = self._REQUIRED_SET - present
+        missing_info = [field for field in self.REQUIRED_FIELDS if field in missing] if missing else []
         
         return {
-            "is_complete": len(missing_info) == 0,
+            "is_complete": not missing,
             "missing_info": missing_info,
-            "completeness_rate": (len(required_fields) - len(missing_info)) / len(required_fields)
+            "completeness_rate": (len(self.REQUIRED_FIELDS) - len(missing)) / len(self.REQUIRED_FIELDS)
         }
     
     def _continue_information_collection(self, 
@@ -288,21 +525,7 @@ class AcademicPaperGenerator:
         Returns:
             响应信息
         """
-        # 根据轮次切换阶段
-        if current_round >= len(self.stage_flow):
-            stage_index = len(self.stage_flow) - 1
-        else:
-            stage_index = current_round
-        
-        next_stage = self.stage_flow[min(stage_index, len(self.stage_flow) - 1)]
-        
-        # 更新阶段
-        self.conversation_manager.update_context(session_id, {
-            "current_stage": next_stage
-        })
-        
-        # 使用多模型协作收集信息
-        conversation_history = self.conversation_manager.get_messages_for_api(session_id, limit=6)
+        next_stage, conversation_history = self._begin_information_collection(session_id, current_round)
         
         response_message = self.collaboration_engine.collect_information(
             current_stage=next_stage,
@@ -310,6 +533,38 @@ class AcademicPaperGenerator:
             conversation_history=conversation_history
         )
         
+        return self._finish_information_collection(session_id, next_stage, response_message, current_round)
+    
+    def _begin_information_collection(self, session_id: str, current_round: int) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        根据轮次切换信息收集阶段
+        
+        Args:
+            session_id: 会话ID
+            current_round: 当前轮次
+            
+        Returns:
+            (下一阶段, 用于API调用的对话历史)
+        """
+        # 根据轮次切换阶段
+        next_stage = self._stage_by_round[min(current_round, len(self._stage_by_round) - 1)]
+        
+        # 更新阶段
+        self.conversation_manager.merge_context(session_id, {"current_stage": next_stage})
+        
+        # 使用多模型协作收集信息
+        conversation_history = self.conversation_manager.get_messages_for_api(
+            session_id, limit=COLLECTION_HISTORY_LIMIT
+        )
+        
+        return next_stage, conversation_history
+    
+    def _finish_information_collection(self,
+                                       session_id: str,
+                                       next_stage: str,
+                                       response_message: str,
+                                       current_round: int) -> Dict[str, Any]:
+        """记录助手回复并构建信息收集阶段的响应"""
         # 添加助手消息
         self.conversation_manager.add_message(session_id, "assistant", response_message)
         
@@ -373,6 +628,19 @@ class AcademicPaperGenerator:
         Returns:
             响应信息
         """
+        return self._last_result(self._iter_paper_generation(session_id, collected_info))
+    
+    def _iter_paper_generation(self, session_id: str, collected_info: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        开始生成论文（流式）
+        
+        Args:
+            session_id: 会话ID
+            collected_info: 已收集的信息
+            
+        Yields:
+            每个章节完成时的section事件，全部完成后的result事件
+        """
         # 更新会话状态
         self.conversation_manager.update_context(session_id, {
             "current_stage": PaperGenerationStage.GENERATING
@@ -396,14 +664,15 @@ class AcademicPaperGenerator:
         
         self.conversation_manager.add_message(session_id, "assistant", notification)
         
-        # 开始生成论文（异步处理）
-        paper_content = self._generate_full_paper(session_id, collected_info)
+        # 开始生成论文，章节按完成顺序逐个推送
+        paper_content = {}
+        for section, content in self._iter_full_paper(session_id, collected_info):
+            paper_content[section] = content
+            yield {"type": "section", "section": section, "content": content}
+        paper_content = self._order_sections(paper_content)
         
         # 保存论文内容
-        self.conversation_manager.update_context(session_id, {
-            "paper_content": paper_content,
-            "current_stage": PaperGenerationStage.COMPLETED
-        })
+        self.save_paper_content(session_id, paper_content, current_stage=PaperGenerationStage.COMPLETED)
         
         # 更新会话状态
         self.conversation_manager.update_session_status(session_id, "completed")
@@ -421,13 +690,13 @@ class AcademicPaperGenerator:
         
         self.conversation_manager.add_message(session_id, "assistant", completion_message)
         
-        return {
+        yield {"type": "result", "data": {
             "session_id": session_id,
             "stage": PaperGenerationStage.COMPLETED,
             "message": completion_message,
             "paper_content": paper_content,
             "status": "completed"
-        }
+        }}
     
     def _generate_full_paper(self, session_id: str, collected_info: Dict[str, Any]) -> Dict[str, str]:
         """
@@ -440,34 +709,126 @@ class AcademicPaperGenerator:
         Returns:
             论文内容字典
         """
-        paper_content = {}
+        return self._order_sections(dict(self._iter_full_paper(session_id, collected_info)))
+    
+    def _iter_full_paper(self, session_id: str, collected_info: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+        """
+        生成完整论文，按完成顺序逐个返回章节，全部完成后记录生成过程
         
-        sections = [
-            PaperSection.ABSTRACT,
-            PaperSection.INTRODUCTION,
-            PaperSection.LITERATURE_REVIEW,
-            PaperSection.METHODOLOGY,
-            PaperSection.RESULTS,
-            PaperSection.DISCUSSION,
-            PaperSection.CONCLUSION
-        ]
+        Args:
+            session_id: 会话ID
+            collected_info: 已收集的信息
+            
+        Yields:
+            (章节, 章节内容)
+        """
+        print(f"正在并发生成 {len(PaperSection.ORDER)} 个章节...")
         
-        for section in sections:
-            print(f"正在生成 {section}...")
+        # 使用多模型协作生成高质量内容，各章节并发执行
+        results = {}
+        for section, result in self.collaboration_engine.collaborative_generation_stream(
+            sections=list(PaperSection.ORDER),
+            collected_info=collected_info,
+            iterations=1,  # 可以根据需要调整迭代次数
+            collected_info_text=self._collected_info_text(session_id)
+        ):
+            results[section] = result
+            yield section, result["final_content"]
+        
+        # 记录生成过程
+        self.conversation_manager.update_context(session_id, {
+            f"{section}_generation_process": result["iterations"]
+            for section, result in results.items()
+        })
+    
+    def _collected_info_text(self, session_id: str) -> Optional[str]:
+        """
+        获取会话已收集信息的格式化文本
+        
+        格式化结果按会话的collected_info版本缓存，信息未变化时多次生成直接复用。
+        
+        Args:
+            session_id: 会话ID
             
-            # 使用多模型协作生成高质量内容
-            result = self.collaboration_engine.collaborative_generation(
-                section=section,
-                collected_info=collected_info,
-                iterations=1  # 可以根据需要调整迭代次数
-            )
+        Returns:
+            格式化文本，会话不存在时返回None
+        """
+        session = self.conversation_manager.get_session(session_id)
+        if session is None:
+            return None
+        
+        cached = session.formatted_info
+        if cached is not None and cached[0] == session.info_version:
+            return cached[1]
+        
+        text = PromptTemplates._format_collected_info(session.context.get("collected_info", {}))
+        session.formatted_info = (session.info_version, text)
+        return text
+    
+    @staticmethod
+    def _order_sections(paper_content: Dict[str, str]) -> Dict[str, str]:
+        """按章节顺序排列论文内容"""
+        return {section: paper_content[section] for section in PaperSection.ORDER if section in paper_content}
+    
+    def generate_paper_stream(self, session_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        直接生成完整论文（流式），每个章节完成即返回
+        
+        Args:
+            session_id: 会话ID
             
-            paper_content[section] = result["final_content"]
+        Yields:
+            {"type": "section", "section": "...", "content": "..."}，
+            全部完成并保存后为 {"type": "result", "data": {...}}
+        """
+        context = self.conversation_manager.get_context(session_id)
+        collected_info = context.get("collected_info", {})
+        
+        paper_content = {}
+        for section, content in self._iter_full_paper(session_id, collected_info):
+            paper_content[section] = content
+            yield {"type": "section", "section": section, "content": content}
+        paper_content = self._order_sections(paper_content)
+        
+        # 保存论文内容
+        self.save_paper_content(session_id, paper_content, current_stage=PaperGenerationStage.COMPLETED)
+        
+        # 更新会话状态
+        self.conversation_manager.update_session_status(session_id, "completed")
+        
+        yield {"type": "result", "data": {
+            "paper_content": paper_content,
+            "session_id": session_id
+        }}
+    
+    def generate_all_sections(self, session_id: str) -> Dict[str, str]:
+        """
+        批量快速生成完整论文
+        
+        所有章节的生成请求一次性批量发送，不经过多模型审核与优化迭代，
+        适用于需要快速获得初稿的场景。
+        
+        Args:
+            session_id: 会话ID
             
-            # 记录生成过程
-            self.conversation_manager.update_context(session_id, {
-                f"{section}_generation_process": result["iterations"]
-            })
+        Returns:
+            论文内容字典
+        """
+        context = self.conversation_manager.get_context(session_id)
+        collected_info = context.get("collected_info", {})
+        
+        paper_content = self.collaboration_engine.generate_sections(
+            list(PaperSection.ORDER),
+            collected_info,
+            single_request=self.single_request_draft,
+            collected_info_text=self._collected_info_text(session_id)
+        )
+        
+        # 保存论文内容
+        self.save_paper_content(session_id, paper_content, current_stage=PaperGenerationStage.COMPLETED)
+        
+        # 更新会话状态
+        self.conversation_manager.update_session_status(session_id, "completed")
         
         return paper_content
     
@@ -487,20 +848,20 @@ class AcademicPaperGenerator:
         context = self.conversation_manager.get_context(session_id)
         collected_info = context.get("collected_info", {})
         
-        # 重新生成
+        # 重新生成（跳过响应缓存，确保得到新的内容）
         result = self.collaboration_engine.collaborative_generation(
             section=section,
             collected_info=collected_info,
-            iterations=1
+            iterations=1,
+            use_cache=False,
+            collected_info_text=self._collected_info_text(session_id)
         )
         
         # 更新论文内容
         paper_content = context.get("paper_content", {})
         paper_content[section] = result["final_content"]
         
-        self.conversation_manager.update_context(session_id, {
-            "paper_content": paper_content
-        })
+        self.save_paper_content(session_id, paper_content)
         
         return {
             "session_id": session_id,
@@ -509,6 +870,46 @@ class AcademicPaperGenerator:
             "status": "success"
         }
     
+    def save_paper_content(self, session_id: str, paper_content: Dict[str, str], **context_updates):
+        """
+        保存论文内容，同时更新内容的ETag
+        
+        Args:
+            session_id: 会话ID
+            paper_content: 论文内容
+            **context_updates: 需要一并更新的其他上下文字段
+        """
+        self.conversation_manager.update_context(session_id, {
+            "paper_content": paper_content,
+            "paper_etag": self._compute_etag(paper_content),
+            **context_updates
+        })
+    
+    def get_paper_etag(self, session_id: str) -> Optional[str]:
+        """
+        获取论文内容的ETag
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            ETag，论文内容不存在时返回None
+        """
+        context = self.conversation_manager.get_context(session_id)
+        paper_content = context.get("paper_content")
+        if not paper_content:
+            return None
+        
+        # 兼容ETag功能加入之前保存的会话
+        if "paper_etag" not in context:
+            context["paper_etag"] = self._compute_etag(paper_content)
+        return context["paper_etag"]
+    
+    @staticmethod
+    def _compute_etag(paper_content: Dict[str, str]) -> str:
+        """计算论文内容的ETag"""
+        return hashlib.md5(orjson.dumps(paper_content, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    
     def get_paper_content(self, session_id: str) -> Optional[Dict[str, str]]:
         """
         获取论文内容
@@ -533,67 +934,79 @@ class AcademicPaperGenerator:
         Returns:
             论文文本
         """
-        paper_content = self.get_paper_content(session_id)
+        return "".join(self._iter_export(self.get_paper_content(session_id), format))
+    
+    def export_paper_iter(self, session_id: str, format: str = "markdown") -> Iterator[bytes]:
+        """
+        以流的形式导出论文，按章节逐块产出UTF-8字节
         
+        Args:
+            session_id: 会话ID
+            format: 导出格式
+            
+        Returns:
+            UTF-8编码的文本块迭代器
+        """
+        for chunk in self._iter_export(self.get_paper_content(session_id), format):
+            yield chunk.encode("utf-8")
+    
+    def _iter_export(self, paper_content: Optional[Dict[str, str]], format: str) -> Iterator[str]:
+        """按导出格式分派到对应的分块生成器"""
         if not paper_content:
-            return ""
+            return iter(())
         
-        if format == "markdown":
-            return self._export_as_markdown(paper_content)
-        elif format == "text":
+        if format == "text":
             return self._export_as_text(paper_content)
-        else:
-            return self._export_as_markdown(paper_content)
+        return self._export_as_markdown(paper_content)
     
-    def _export_as_markdown(self, paper_content: Dict[str, str]) -> str:
+    def _export_as_markdown(self, paper_content: Dict[str, str]) -> Iterator[str]:
         """导出为Markdown格式"""
-        sections_order = [
-            ("abstract", "摘要 (Abstract)"),
-            ("introduction", "引言 (Introduction)"),
-            ("literature_review", "文献综述 (Literature Review)"),
-            ("methodology", "研究方法 (Methodology)"),
-            ("results", "研究结果 (Results)"),
-            ("discussion", "讨论 (Discussion)"),
-            ("conclusion", "结论 (Conclusion)")
-        ]
-        
-        markdown = "# 学术论文\n\n"
-        markdown += f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        markdown += "---\n\n"
-        
-        for section_key, section_title in sections_order:
-            if section_key in paper_content:
-                markdown += f"## {section_title}\n\n"
-                markdown += paper_content[section_key]
-                markdown += "\n\n"
-        
-        return markdown
+        return self._export_with_template(
+            paper_content, self.MARKDOWN_TEMPLATE, self.MARKDOWN_HEADER, self.MARKDOWN_SECTION, self.MARKDOWN_SECTIONS
+        )
     
-    def _export_as_text(self, paper_content: Dict[str, str]) -> str:
+    def _export_as_text(self, paper_content: Dict[str, str]) -> Iterator[str]:
         """导出为纯文本格式"""
-        sections_order = [
-            ("abstract", "摘要"),
-            ("introduction", "引言"),
-            ("literature_review", "文献综述"),
-            ("methodology", "研究方法"),
-            ("results", "研究结果"),
-            ("discussion", "讨论"),
-            ("conclusion", "结论")
-        ]
-        
-        text = "=" * 60 + "\n"
-        text += "学术论文\n"
-        text += f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        text += "=" * 60 + "\n\n"
+        return self._export_with_template(
+            paper_content, self.TEXT_TEMPLATE, self.TEXT_HEADER, self.TEXT_SECTION, self.TEXT_SECTIONS
+        )
+    
+    def _export_with_template(self,
+                              paper_content: Dict[str, str],
+                              template: str,
+                              header: str,
+                              section_format: str,
+                              sections: Tuple[Tuple[str, str], ...]) -> Iterator[str]:
+        """
+        按模板导出论文
         
-        for section_key, section_title in sections_order:
-            if section_key in paper_content:
-                text += f"{section_title}\n"
-                text += "-" * 60 + "\n\n"
-                text += paper_content[section_key]
-                text += "\n\n"
+        章节齐全时整篇模板一次format_map完成；缺少章节时逐章节格式化，跳过缺少的章节。
         
-        return text
+        Args:
+            paper_content: 论文内容
+            template: 整篇模板
+            header: 文件头格式
+            section_format: 章节格式
+            sections: (章节键, 章节标题) 列表
+            
+        Yields:
+            导出文本块
+        """
+        export_time = self._export_time()
+        if all(key in paper_content for key, _ in sections):
+            yield template.format_map({**paper_content, "_ts": export_time})
+            return
+        
+        yield header.format(_ts=export_time)
+        for key, title in sections:
+            content = paper_content.get(key)
+            if content is not None:
+                yield section_format.format(title=title, content=content)
+    
+    @staticmethod
+    def _export_time() -> str:
+        """导出文件头中的生成时间"""
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 
 # 全局论文生成器实例
@@ -13,6 +13,46 @@ class PromptTemplates:
 你的任务是帮助研究者撰写高质量的学术论文，确保论文的学术性、严谨性和创新性。
 你擅长引导用户提供详细信息，并能够根据信息生成结构完整、逻辑清晰的学术论文。"""
 
+    # 信息提取的字段，提取结果和信息完整性检查都使用这些字段名
+    EXTRACTION_FIELDS = (
+        "研究主题", "研究背景", "研究目标", "研究方法", "数据来源", "研究发现",
+        "理论基础", "文献引用", "研究问题", "研究意义", "研究局限", "未来方向"
+    )
+    
+    # 信息收集问题中的标签到提取字段的映射，用户按标签逐条作答时据此归一化
+    EXTRACTION_FIELD_ALIASES = {
+        "相关理论基础": "理论基础",
+        "理论框架": "理论基础",
+        "研究设计": "研究方法",
+        "数据收集方法": "研究方法",
+        "分析方法": "研究方法",
+        "研究工具": "研究方法",
+        "主要发现": "研究发现"
+    }
+
+    # 信息提取的系统提示词：固定不变，放在每次请求的最前面，便于服务端复用前缀缓存
+    INFORMATION_EXTRACTION = """你是信息提取专家，擅长从文本中提取结构化信息。
+
+请从用户输入中提取学术论文相关的信息，并以结构化方式返回。
+
+请提取以下类型的信息（如果有）：
+""" + "\n".join(f"- {field}" for field in EXTRACTION_FIELDS) + """
+
+请以JSON格式返回提取的信息，例如：
+{
+    "研究主题": "...",
+    "研究背景": "...",
+    ...
+}
+
+如果某项信息不存在，请忽略该字段。"""
+    
+    # 信息提取的用户消息：只包含每轮变化的内容
+    INFORMATION_EXTRACTION_INPUT = """当前阶段：{stage}
+
+用户输入：
+{user_input}"""
+
     # 信息收集阶段的提示词
     INFORMATION_COLLECTION = {
         "initial": """作为学术论文写作专家，我将帮助您撰写一篇高质量的学术论文。
@@ -181,6 +221,19 @@ class PromptTemplates:
 请生成结论内容："""
     }
     
+    # 一次请求生成多个章节的提示词
+    ALL_SECTIONS_GENERATION = """基于以下研究信息，请一次性生成学术论文的多个部分：
+
+{collected_info}
+
+各部分的要求如下：
+
+{section_requirements}
+
+输出格式：
+只输出一个JSON对象，键依次为 {section_keys}，值为对应部分的完整正文（字符串）。
+不要输出JSON以外的任何文字，也不要使用代码块标记。"""
+    
     # 质量审核的提示词
     QUALITY_REVIEW = """请作为一位严格的学术审稿人，对以下论文内容进行审核：
 
@@ -273,6 +326,12 @@ class PromptTemplates:
 请提供优化方案或优化后的内容："""
     }
     
+    # 各章节的写作要求（取自内容生成模板的"要求"部分），在导入时提取一次
+    SECTION_REQUIREMENTS = {
+        section: template.split("要求：", 1)[-1].rsplit("\n\n", 1)[0].strip()
+        for section, template in CONTENT_GENERATION.items()
+    }
+    
     @staticmethod
     def get_information_collection_prompt(stage: str) -> str:
         """获取信息收集阶段的提示词"""
@@ -282,12 +341,28 @@ class PromptTemplates:
         )
     
     @staticmethod
-    def get_content_generation_prompt(section: str, collected_info: Dict) -> str:
-        """获取内容生成提示词"""
+    def get_content_generation_prompt(section: str, collected_info: Dict, info_text: str = None) -> str:
+        """获取内容生成提示词，info_text为预先格式化的已收集信息"""
         template = PromptTemplates.CONTENT_GENERATION.get(section, "")
-        info_text = PromptTemplates._format_collected_info(collected_info)
+        if info_text is None:
+            info_text = PromptTemplates._format_collected_info(collected_info)
         return template.format(collected_info=info_text)
     
+    @staticmethod
+    def get_all_sections_prompt(sections: List[str], collected_info: Dict, info_text: str = None) -> str:
+        """获取一次请求生成多个章节的提示词，各章节要求取自对应的内容生成模板"""
+        if info_text is None:
+            info_text = PromptTemplates._format_collected_info(collected_info)
+        
+        requirements = PromptTemplates.SECTION_REQUIREMENTS
+        return PromptTemplates.ALL_SECTIONS_GENERATION.format(
+            collected_info=info_text,
+            section_requirements="\n\n".join(
+                f"【{section}】\n{requirements.get(section, '')}" for section in sections
+            ),
+            section_keys="、".join(sections)
+        )
+    
     @staticmethod
     def get_quality_review_prompt(content: str) -> str:
         """获取质量审核提示词"""
@@ -310,19 +385,13 @@ class PromptTemplates:
         if not collected_info:
             return "暂无收集的信息"
         
-        formatted = []
-        for key, value in collected_info.items():
-            if value:
-                formatted.append(f"**{key}**: {value}")
-        
-        return "\n".join(formatted) if formatted else "暂无收集的信息"
+        return "\n".join([f"**{key}**: {value}" for key, value in collected_info.items() if value]) or "暂无收集的信息"
 
 
 class PromptBuilder:
-    """提示词构建器"""
+    """提示词构建器（无状态，模板均为PromptTemplates的类属性，使用全局实例prompt_builder）"""
     
-    def __init__(self):
-        self.templates = PromptTemplates()
+    __slots__ = ()
     
     def build_system_message(self, role: str = None) -> Dict[str, str]:
         """
@@ -0,0 +1,160 @@
+"""
+LLM响应缓存 - 对确定性请求进行精确匹配缓存
+"""
+import os
+import time
+import orjson
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class InMemoryLRU:
+    """基于OrderedDict的内存LRU缓存"""
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期条目视为未命中"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCacheBackend:
+    """基于diskcache的持久化缓存（需要安装diskcache）"""
+    
+    def __init__(self, directory: str = "./data/llm_cache"):
+        import diskcache
+        self._cache = diskcache.Cache(directory)
+    
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+    
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self._cache.set(key, value, expire=ttl)
+    
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class ResponseCache:
+    """LLM响应缓存，仅缓存temperature为0的确定性请求"""
+    
+    def __init__(self, backend=None, ttl: int = 86400):
+        self.backend = backend or InMemoryLRU()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def cache_key(base_url: str,
+                  model: str,
+                  messages: List[Dict[str, str]],
+                  temperature: float,
+                  max_tokens: int,
+                  json_mode: bool = False) -> Optional[str]:
+        """
+        计算缓存键
+        
+        Args:
+            base_url: 服务地址
+            model: 模型名称
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大token数
+            json_mode: 是否要求JSON输出
+            
+        Returns:
+            缓存键；非确定性请求（temperature > 0）返回None
+        """
+        if temperature > 0:
+            return None
+        
+        key_data = {
+            "base_url": base_url,
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        # 只在JSON模式下加入该字段，普通请求的缓存键保持不变
+        if json_mode:
+            key_data["json_mode"] = True
+        
+        # orjson直接输出UTF-8字节，省去字符串编码这一步
+        raw = orjson.dumps(key_data, option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(raw).hexdigest()
+    
+    def get(self, key: Optional[str]) -> Optional[str]:
+        """读取缓存，key为None时直接返回None"""
+        if key is None:
+            return None
+        
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+    
+    def set(self, key: Optional[str], value: str):
+        """写入缓存，key为None或响应为空时忽略"""
+        if key is None or not value:
+            return
+        self.backend.set(key, value, ttl=self.ttl)
+    
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            "backend": type(self.backend).__name__,
+            "size": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def _create_response_cache() -> ResponseCache:
+    """根据环境变量创建响应缓存"""
+    ttl = int(os.getenv("LLM_CACHE_TTL", 86400))
+    
+    if os.getenv("LLM_CACHE_BACKEND", "memory").lower() == "disk":
+        try:
+            backend = DiskCacheBackend(os.getenv("LLM_CACHE_DIR", "./data/llm_cache"))
+            return ResponseCache(backend, ttl)
+        except ImportError:
+            print("⚠ 未安装diskcache，LLM响应缓存回退为内存缓存")
+    
+    return ResponseCache(InMemoryLRU(int(os.getenv("LLM_CACHE_SIZE", 1024))), ttl)
+
+
+# 全局响应缓存实例
+response_cache = _create_response_cache()
@@ -0,0 +1,128 @@
+"""
+语义缓存 - 基于向量相似度复用近似重复提示词的响应
+"""
+import os
+import threading
+from collections import deque
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SemanticCache:
+    """
+    语义缓存
+    
+    使用句向量模型对提示词编码，通过FAISS内积索引（向量已归一化，即余弦相似度）
+    查找相似度不低于阈值的历史响应。依赖sentence-transformers、faiss和numpy。
+    """
+    
+    def __init__(self,
+                 dim: int = 384,
+                 threshold: float = 0.95,
+                 cap: int = 10_000,
+                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+        import faiss
+        import numpy as np
+        from sentence_transformers import SentenceTransformer
+        
+        self._np = np
+        self._model = SentenceTransformer(model_name)
+        self.dim = dim
+        self.threshold = threshold
+        self.cap = cap
+        
+        self._index = faiss.IndexFlatIP(dim)
+        # 按写入顺序保存 (向量, 命名空间, 响应)，用于FIFO淘汰和重建索引
+        self._entries: deque = deque()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _embed(self, text: str):
+        """编码并归一化文本向量"""
+        vec = self._model.encode([text], normalize_embeddings=True)
+        return self._np.asarray(vec, dtype="float32").reshape(1, self.dim)
+    
+    def lookup(self, text: str, namespace: str = "") -> Optional[str]:
+        """
+        查找语义相近的缓存响应
+        
+        Args:
+            text: 查询文本
+            namespace: 命名空间，只有命名空间相同的条目才会命中
+            
+        Returns:
+            命中的响应文本，未命中返回None
+        """
+        vec = self._embed(text)
+        with self._lock:
+            if self._index.ntotal == 0:
+                self.misses += 1
+                return None
+            
+            scores, ids = self._index.search(vec, min(5, self._index.ntotal))
+            for score, idx in zip(scores[0], ids[0]):
+                if idx < 0 or score < self.threshold:
+                    break
+                _, entry_namespace, response = self._entries[idx]
+                if entry_namespace == namespace:
+                    self.hits += 1
+                    return response
+            
+            self.misses += 1
+            return None
+    
+    def add(self, text: str, response: str, namespace: str = ""):
+        """
+        写入缓存
+        
+        Args:
+            text: 提示词文本
+            response: 模型响应
+            namespace: 命名空间
+        """
+        if not response:
+            return
+        
+        vec = self._embed(text)
+        with self._lock:
+            self._entries.append((vec, namespace, response))
+            self._index.add(vec)
+            
+            if len(self._entries) > self.cap:
+                # 批量淘汰最早的10%条目后重建索引，避免每次写入都重建
+                for _ in range(max(1, self.cap // 10)):
+                    self._entries.popleft()
+                self._index.reset()
+                self._index.add(self._np.vstack([entry[0] for entry in self._entries]))
+    
+    def stats(self) -> dict:
+        """获取缓存统计信息"""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def _create_semantic_cache() -> Optional[SemanticCache]:
+    """根据环境变量创建语义缓存，未启用或缺少依赖时返回None"""
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() != "true":
+        return None
+    
+    try:
+        return SemanticCache(
+            dim=int(os.getenv("SEMANTIC_CACHE_DIM", 384)),
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+            cap=int(os.getenv("SEMANTIC_CACHE_CAP", 10_000)),
+            model_name=os.getenv("SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        )
+    except ImportError as e:
+        print(f"⚠ 语义缓存依赖缺失，已禁用: {str(e)}")
+        return None
+
+
+# 全局语义缓存实例（未启用时为None）
+semantic_cache = _create_semantic_cache()
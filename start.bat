@@ -28,7 +28,7 @@ if errorlevel 1 (
     echo.
     echo ❌ 错误: 未检测到Python环境！
     echo.
-    echo 请先安装Python 3.8或更高版本：
+    echo 请先安装Python 3.10或更高版本：
     echo    https://www.python.org/downloads/
     echo.
     pause
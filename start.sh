@@ -38,7 +38,7 @@ echo -e "${BLUE}[1/6]${NC} 正在检查Python环境..."
 if ! command -v python3 &> /dev/null; then
     echo -e "${RED}❌ 错误: 未检测到Python3环境！${NC}"
     echo ""
-    echo "请先安装Python 3.8或更高版本："
+    echo "请先安装Python 3.10或更高版本："
     if [[ "$OSTYPE" == "darwin"* ]]; then
         echo "  brew install python3"
     else
@@ -0,0 +1,131 @@
+"""
+后台任务队列 - 在独立线程池中执行耗时的LLM调用
+"""
+import os
+import time
+import uuid
+import inspect
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Callable, Optional
+from dotenv import load_dotenv
+from ai_service import submit_async
+
+load_dotenv()
+
+
+class TaskQueue:
+    """
+    进程内后台任务队列
+    
+    任务在线程池中执行，请求线程提交后立即返回任务ID，客户端通过任务ID轮询结果。
+    协程函数提交到后台共享事件循环执行，等待模型响应期间不占用线程池的工作线程。
+    已结束的任务保留result_ttl秒后清理。
+    """
+    
+    def __init__(self, max_workers: int = 8, result_ttl: int = 3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="paper-task")
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.result_ttl = result_ttl
+    
+    def submit(self, func: Callable, *args, **kwargs) -> str:
+        """
+        提交后台任务
+        
+        Args:
+            func: 任务函数（普通函数或协程函数）
+            *args: 位置参数
+            **kwargs: 关键字参数
+            
+        Returns:
+            任务ID
+        """
+        self._cleanup()
+        
+        task_id = uuid.uuid4().hex
+        with self._lock:
+            self._tasks[task_id] = {
+                "task_id": task_id,
+                "status": "pending",
+                "result": None,
+                "error": None,
+                "created_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "_finished_ts": None
+            }
+        
+        if inspect.iscoroutinefunction(func):
+            self._update(task_id, status="running")
+            future = submit_async(func(*args, **kwargs))
+            future.add_done_callback(lambda done: self._finish(task_id, done))
+        else:
+            self._executor.submit(self._run, task_id, func, args, kwargs)
+        return task_id
+    
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务状态
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            任务信息（status为pending/running/completed/failed），任务不存在返回None
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            return {key: value for key, value in task.items() if not key.startswith("_")}
+    
+    def _run(self, task_id: str, func: Callable, args: tuple, kwargs: dict):
+        """在工作线程中执行任务并记录结果"""
+        self._update(task_id, status="running")
+        try:
+            result = func(*args, **kwargs)
+            self._update(task_id, status="completed", result=result)
+        except Exception as e:
+            self._update(task_id, status="failed", error=str(e))
+    
+    def _finish(self, task_id: str, future: Future):
+        """记录事件循环中执行的协程任务的结果"""
+        if future.cancelled():
+            self._update(task_id, status="failed", error="任务已取消")
+        elif future.exception() is not None:
+            self._update(task_id, status="failed", error=str(future.exception()))
+        else:
+            self._update(task_id, status="completed", result=future.result())
+    
+    def _update(self, task_id: str, **fields):
+        """更新任务字段，任务结束时记录完成时间"""
+        if fields.get("status") in ("completed", "failed"):
+            fields["finished_at"] = datetime.now().isoformat()
+            fields["_finished_ts"] = time.monotonic()
+        
+        with self._lock:
+            if task_id in self._tasks:
+                self._tasks[task_id].update(fields)
+    
+    def _cleanup(self):
+        """清理过期的已结束任务"""
+        cutoff = time.monotonic() - self.result_ttl
+        with self._lock:
+            expired = [
+                task_id for task_id, task in self._tasks.items()
+                if task["_finished_ts"] is not None and task["_finished_ts"] < cutoff
+            ]
+            for task_id in expired:
+                del self._tasks[task_id]
+    
+    def shutdown(self, wait: bool = False):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+
+# 全局任务队列实例
+task_queue = TaskQueue(
+    max_workers=int(os.getenv("TASK_WORKERS", 8)),
+    result_ttl=int(os.getenv("TASK_RESULT_TTL", 3600))
+)
@@ -0,0 +1,6 @@
+"""
+WSGI入口 - 供gunicorn等生产环境服务器加载
+
+启动命令: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app